@@ -1,42 +1,661 @@
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2 import sql
+from psycopg2.pool import PoolError
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Generator, Dict, Any, List
+from collections import deque
+from typing import Generator, Dict, Any, List, Callable, Optional
+import asyncio
+import contextvars
+import datetime
+import decimal
+import functools
+import io
+import itertools
+import json
 import logging
+import re
+import threading
+import time
+import uuid
 from .config import settings
 
 logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(f"{__name__}.slow")
+
+# Connection đang được ghim bởi db.transaction() trong context hiện tại
+_transaction_conn = contextvars.ContextVar('db_transaction_conn', default=None)
+# Các connection được giữ cho HTTP request hiện tại (xem request_scope)
+_request_scope = contextvars.ContextVar('db_request_scope', default=None)
+
+class PoolTimeoutError(PoolError):
+    """Không lấy được connection trong thời gian chờ cho phép"""
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint_query(query: str) -> str:
+    """Chuẩn hóa câu SQL thành fingerprint: gộp khoảng trắng, thay literal
+    và placeholder bằng `?` để các lần gọi cùng câu lệnh được gom chung."""
+    normalized = ' '.join(query.split())
+    return _LITERAL_RE.sub('?', normalized).replace('%s', '?')
+
+class QueryStats:
+    """Histogram thời gian thực thi và số dòng theo từng fingerprint câu lệnh.
+    
+    Query chậm hơn ngưỡng SLOW_QUERY_MS được ghi vào logger `backend.database.slow`
+    (chỉ fingerprint, không ghi tham số hay dữ liệu).
+    """
+    
+    BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+    MAX_FINGERPRINTS = 500
+    OTHER = '__other__'
+    
+    def __init__(self, slow_query_ms: float):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._slow_queries = 0
+    
+    def _new_entry(self) -> Dict[str, Any]:
+        return {
+            'count': 0,
+            'errors': 0,
+            'rows': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'buckets': [0] * (len(self.BUCKETS_MS) + 1),
+        }
+    
+    def record(self, query: str, elapsed: float, rows: int = 0, error: bool = False):
+        fingerprint = fingerprint_query(query)
+        elapsed_ms = elapsed * 1000
+        bucket = len(self.BUCKETS_MS)
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if elapsed_ms <= bound:
+                bucket = i
+                break
+        
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                if len(self._entries) >= self.MAX_FINGERPRINTS:
+                    fingerprint = self.OTHER
+                entry = self._entries.setdefault(fingerprint, self._new_entry())
+            entry['count'] += 1
+            entry['rows'] += rows
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['buckets'][bucket] += 1
+            if error:
+                entry['errors'] += 1
+            slow = elapsed_ms >= self.slow_query_ms
+            if slow:
+                self._slow_queries += 1
+        
+        if slow:
+            slow_query_logger.warning(f"Slow query ({elapsed_ms:.1f} ms, {rows} rows): {fingerprint}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot thống kê, sắp theo tổng thời gian giảm dần (bucket dạng cumulative `le`)"""
+        with self._lock:
+            queries = []
+            for fingerprint, entry in self._entries.items():
+                cumulative = 0
+                buckets = {}
+                for bound, count in zip(self.BUCKETS_MS + ('+Inf',), entry['buckets']):
+                    cumulative += count
+                    buckets[str(bound)] = cumulative
+                queries.append({
+                    'fingerprint': fingerprint,
+                    'count': entry['count'],
+                    'errors': entry['errors'],
+                    'rows': entry['rows'],
+                    'total_ms': round(entry['total_ms'], 3),
+                    'avg_ms': round(entry['total_ms'] / entry['count'], 3),
+                    'max_ms': round(entry['max_ms'], 3),
+                    'buckets_ms': buckets,
+                })
+            slow_queries = self._slow_queries
+        queries.sort(key=lambda q: q['total_ms'], reverse=True)
+        return {
+            'slow_query_threshold_ms': self.slow_query_ms,
+            'slow_queries': slow_queries,
+            'queries': queries,
+        }
+    
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._slow_queries = 0
+
+def _cast_timestamp(value, cursor):
+    # Với DateStyle ISO, Postgres trả '2024-01-01 08:00:00.123456': chỉ cần đổi
+    # dấu cách thành 'T' là được chuỗi giống datetime.isoformat(), không phải
+    # dựng đối tượng datetime rồi format lại
+    return value.replace(' ', 'T', 1) if value is not None else None
+
+def _cast_date(value, cursor):
+    return value
+
+def _cast_numeric(value, cursor):
+    return float(value) if value is not None else None
+
+# Decoder theo kiểu cột (OID), đăng ký trên từng connection của pool: timestamp/date
+# đi thẳng thành chuỗi ISO, numeric thành float, ngay khi đọc dữ liệu
+TIMESTAMP_ISO = psycopg2.extensions.new_type((1114,), 'TIMESTAMP_ISO', _cast_timestamp)
+DATE_ISO = psycopg2.extensions.new_type((1082,), 'DATE_ISO', _cast_date)
+NUMERIC_FLOAT = psycopg2.extensions.new_type((1700,), 'NUMERIC_FLOAT', _cast_numeric)
+
+class RowDecoder:
+    """Đổi tuple row thành dict; tên cột được lấy một lần cho mỗi query
+    thay vì dựng RealDictRow cho từng dòng."""
+    
+    __slots__ = ('columns',)
+    
+    def __init__(self, description):
+        self.columns = tuple(column.name for column in description)
+    
+    def one(self, row) -> Optional[Dict[str, Any]]:
+        return dict(zip(self.columns, row)) if row is not None else None
+    
+    def all(self, rows) -> List[Dict[str, Any]]:
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in rows]
+
+def _fetch_all(cursor) -> List[Dict[str, Any]]:
+    return RowDecoder(cursor.description).all(cursor.fetchall())
+
+def _fetch_one(cursor) -> Optional[Dict[str, Any]]:
+    return RowDecoder(cursor.description).one(cursor.fetchone())
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Connection do pool tạo ra: đăng ký decoder theo kiểu cột và nhớ các
+    prepared statement đã PREPARE trên session"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        for type_caster in (TIMESTAMP_ISO, DATE_ISO, NUMERIC_FLOAT):
+            psycopg2.extensions.register_type(type_caster, self)
+
+class PreparedStatementRegistry:
+    """Danh sách các câu lệnh hay dùng được PREPARE lazily trên từng connection.
+    
+    Câu lệnh đăng ký với placeholder %s như các query khác; registry đổi sang
+    $1, $2... cho PREPARE. Đếm hit (connection đã có sẵn statement) và miss
+    (phải PREPARE mới) để theo dõi hit rate.
+    """
+    
+    def __init__(self):
+        self._statements = {}  # name -> (sql, số tham số)
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+    
+    def register(self, name: str, query: str):
+        if not re.fullmatch(r'[a-z_][a-z0-9_]*', name):
+            raise ValueError(f"Invalid prepared statement name: {name}")
+        counter = iter(range(1, query.count('%s') + 1))
+        sql = re.sub(r'%s', lambda _: f"${next(counter)}", query)
+        with self._lock:
+            self._statements[name] = (sql, query.count('%s'))
+            self._hits.setdefault(name, 0)
+            self._misses.setdefault(name, 0)
+    
+    def get(self, name: str):
+        try:
+            return self._statements[name]
+        except KeyError:
+            raise ValueError(f"Prepared statement '{name}' is not registered")
+    
+    def record(self, name: str, hit: bool):
+        with self._lock:
+            if hit:
+                self._hits[name] += 1
+            else:
+                self._misses[name] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self._hits.values())
+            misses = sum(self._misses.values())
+            total = hits + misses
+            return {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+                'statements': {
+                    name: {'hits': self._hits[name], 'misses': self._misses[name]}
+                    for name in self._statements
+                },
+            }
+
+class ConnectionPool:
+    """Connection pool thread-safe.
+    
+    Khi tất cả connection đang bận, getconn() chờ (tối đa `timeout` giây)
+    cho tới khi có connection được trả về thay vì báo PoolError ngay.
+    Pool ghi lại thống kê (in-use, idle, thời gian chờ, checkout latency)
+    để endpoint /metrics đọc.
+    """
+    
+    def __init__(self, dsn: str, minconn: int, maxconn: int, timeout: float):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: minconn={minconn}, maxconn={maxconn}")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.closed = False
+        
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._in_use = {}  # connection -> thời điểm checkout
+        self._opening = 0
+        self._waiting = 0
+        
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+        self._hold_time_total = 0.0
+        self._returns = 0
+        
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+    
+    def _connect(self):
+        return psycopg2.connect(self.dsn, connection_factory=PooledConnection)
+    
+    def getconn(self, timeout: Optional[float] = None):
+        """Lấy connection từ pool, chờ nếu pool đang đầy"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn = None
+        waited = 0.0
+        
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    if conn.closed:
+                        # Connection đã bị đóng từ phía server, bỏ đi và thử lại
+                        conn = None
+                        continue
+                    break
+                if len(self._in_use) + self._opening < self.maxconn:
+                    self._opening += 1
+                    break
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {timeout:.1f}s waiting for a database connection "
+                        f"(pool size {self.maxconn})"
+                    )
+                wait_start = time.monotonic()
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                    waited += time.monotonic() - wait_start
+        
+        if conn is None:
+            # Mở connection mới ngoài lock để không chặn các thread khác
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._opening -= 1
+        
+        now = time.monotonic()
+        latency = now - start
+        with self._cond:
+            self._in_use[conn] = now
+            self._checkouts += 1
+            if waited > 0:
+                self._waits += 1
+                self._wait_time_total += waited
+                self._wait_time_max = max(self._wait_time_max, waited)
+            self._checkout_time_total += latency
+            self._checkout_time_max = max(self._checkout_time_max, latency)
+        return conn
+    
+    def putconn(self, conn, close: bool = False):
+        """Trả connection về pool (rollback transaction còn dở nếu có)"""
+        if not conn.closed and not close:
+            try:
+                status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception as e:
+                logger.warning(f"Discarding broken pooled connection: {e}")
+                close = True
+        
+        with self._cond:
+            checked_out_at = self._in_use.pop(conn, None)
+            if checked_out_at is None:
+                raise PoolError("trying to put unkeyed connection")
+            self._returns += 1
+            self._hold_time_total += time.monotonic() - checked_out_at
+            if close or conn.closed or self.closed:
+                if not conn.closed:
+                    conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+    
+    def closeall(self):
+        """Đóng toàn bộ connection trong pool"""
+        with self._cond:
+            self.closed = True
+            conns = list(self._idle) + list(self._in_use)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+    
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê hiện tại của pool (thời gian tính bằng ms)"""
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'opening': self._opening,
+                'waiting': self._waiting,
+                'checkouts': checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time_total_ms': round(self._wait_time_total * 1000, 3),
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3),
+                'checkout_latency_avg_ms': round(self._checkout_time_total * 1000 / checkouts, 3) if checkouts else 0.0,
+                'checkout_latency_max_ms': round(self._checkout_time_max * 1000, 3),
+                'hold_time_avg_ms': round(self._hold_time_total * 1000 / self._returns, 3) if self._returns else 0.0,
+            }
+
+def _copy_text_value(value) -> str:
+    """Encode một giá trị theo COPY text format.
+    
+    dict/list -> JSON, bytes -> bytea hex, datetime/date/time -> ISO 8601.
+    Kiểu khác ngoài str/số/UUID thì TypeError thay vì ghi repr của Python.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        text = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        text = '\\x' + bytes(value).hex()
+    elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        text = value.isoformat()
+    elif isinstance(value, (str, int, float, decimal.Decimal, uuid.UUID)):
+        text = str(value)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} for COPY")
+    return (text
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+class _CopyRowsReader(io.TextIOBase):
+    """File-like object sinh dữ liệu COPY (text format) lazily từ một iterable
+    các tuple, để COPY ... FROM STDIN không cần dựng toàn bộ buffer trong bộ nhớ."""
+    
+    def __init__(self, rows):
+        self._lines = ('\t'.join(map(_copy_text_value, row)) + '\n' for row in rows)
+        self._buffer = ''
+    
+    def readable(self) -> bool:
+        return True
+    
+    def read(self, size: int = -1) -> str:
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size is None or size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = ''.join(chunks)
+        if size is None or size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+_WRITE_KEYWORD_RE = re.compile(r'\b(INSERT|UPDATE|DELETE)\b')
+
+def _is_read_query(query: str) -> bool:
+    """SELECT thuần hoặc WITH ... SELECT không ghi dữ liệu (không khóa dòng) thì có thể chạy trên replica"""
+    normalized = query.lstrip().upper()
+    if normalized.startswith('WITH'):
+        if _WRITE_KEYWORD_RE.search(normalized):
+            return False
+    elif not normalized.startswith('SELECT'):
+        return False
+    return 'FOR UPDATE' not in normalized and 'FOR SHARE' not in normalized
+
+class RequestScope:
+    """Connection dùng chung trong một HTTP request.
+    
+    Giữ tối đa một connection primary và một connection replica. Khi đã có
+    connection primary thì mọi câu lệnh (kể cả đọc) đều dùng nó; connection
+    replica chỉ dùng cho câu lệnh đọc khi không bị sticky về primary.
+    Connection chỉ được checkout ở lần dùng đầu tiên (xem Database.run), nên
+    request không đụng tới database (vd: export stream qua connection riêng)
+    không giữ connection nào.
+    """
+    
+    def __init__(self, database: 'Database', readonly: bool = False):
+        self.database = database
+        self.readonly = readonly
+        self.closed = False
+        self._conns = {}  # 'primary' | 'replica' -> (pool, connection)
+        self._lock = threading.Lock()
+    
+    @property
+    def idle(self) -> bool:
+        """Scope còn mở nhưng chưa giữ connection nào"""
+        return not self.closed and not self._conns
+    
+    def acquire(self, readonly: bool):
+        with self._lock:
+            if self.closed:
+                raise PoolError("request scope is closed")
+            if 'primary' in self._conns:
+                return self._conns['primary'][1]
+            pool = self.database._read_pool() if readonly else self.database.pool
+            if pool is not self.database.pool and 'replica' in self._conns:
+                return self._conns['replica'][1]
+            pool, conn = self.database._checkout(pool)
+            slot = 'primary' if pool is self.database.pool else 'replica'
+            self._conns[slot] = (pool, conn)
+            return conn
+    
+    def release(self):
+        with self._lock:
+            self.closed = True
+            conns = list(self._conns.values())
+            self._conns.clear()
+        for pool, conn in conns:
+            pool.putconn(conn)
 
 class Database:
     def __init__(self):
         self.pool = None
+        self.replicas = []
+        self._replica_cycle = None
+        self._last_write = None
+        self.executor = None
+        self.prepared = PreparedStatementRegistry()
+        self.queries = QueryStats(settings.get_slow_query_ms())
     
     def connect(self):
         """Tạo connection pool"""
         try:
-            self.pool = SimpleConnectionPool(
-                minconn=1,
-                maxconn=10,
-                dsn=settings.get_database_url()
+            self.pool = ConnectionPool(
+                dsn=settings.get_database_url(),
+                minconn=settings.get_db_pool_min_size(),
+                maxconn=settings.get_db_pool_max_size(),
+                timeout=settings.get_db_pool_timeout()
             )
-            logger.info("Database connection pool created successfully")
+            self.replicas = [
+                ConnectionPool(
+                    dsn=replica_url,
+                    minconn=settings.get_db_pool_min_size(),
+                    maxconn=settings.get_db_pool_max_size(),
+                    timeout=settings.get_db_pool_timeout()
+                )
+                for replica_url in settings.get_database_replica_urls()
+            ]
+            self._replica_cycle = itertools.cycle(self.replicas) if self.replicas else None
+            # Checkout đầu tiên của request chạy ngoài executor (xem run), nên worker chỉ
+            # chờ pool khi request đang giữ connection replica cần thêm connection primary
+            # (ghi / transaction trong GET). Mỗi connection (primary hoặc replica) có một
+            # worker: các worker đang chờ primary không chiếm hết worker của các request
+            # đang giữ primary, vốn cần worker để chạy xong và trả connection
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.pool.maxconn + sum(replica.maxconn for replica in self.replicas),
+                thread_name_prefix="db"
+            )
+            logger.info(f"Database connection pool created successfully ({len(self.replicas)} replica(s))")
         except Exception as e:
             logger.error(f"Error creating database connection pool: {e}")
             raise
     
     def close(self):
         """Đóng connection pool"""
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for replica in self.replicas:
+            replica.closeall()
+        self.replicas = []
+        self._replica_cycle = None
         if self.pool:
             self.pool.closeall()
             logger.info("Database connection pool closed")
     
+    def pool_stats(self) -> Dict[str, Any]:
+        """Thống kê connection pool cho /metrics"""
+        if not self.pool:
+            return {}
+        return {
+            'primary': self.pool.stats(),
+            'replicas': [replica.stats() for replica in self.replicas]
+        }
+    
+    def prepared_stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss của prepared statement cho /metrics"""
+        return self.prepared.stats()
+    
+    def query_stats(self) -> Dict[str, Any]:
+        """Histogram thời gian query theo fingerprint cho /metrics"""
+        return self.queries.stats()
+    
+    async def run(self, func: Callable, *args, **kwargs):
+        """Chạy một hàm truy vấn đồng bộ (vd: method của model) trên executor
+        của database để không chặn event loop của uvicorn.
+        
+        Context hiện tại (contextvars) được copy sang worker thread.
+        """
+        loop = asyncio.get_running_loop()
+        scope = _request_scope.get()
+        if scope is not None and scope.idle:
+            # Checkout lần đầu của request trên executor mặc định chứ không phải
+            # db.executor: các request đang chờ pool không chiếm worker của database
+            # (trường hợp còn lại xem kích thước executor trong connect())
+            await loop.run_in_executor(None, scope.acquire, scope.readonly)
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+    
+    def _mark_write(self):
+        self._last_write = time.monotonic()
+    
+    def _read_pool(self) -> ConnectionPool:
+        """Chọn pool cho câu lệnh chỉ đọc.
+        
+        Đọc từ replica (round-robin) trừ khi vừa có lệnh ghi trong vòng
+        REPLICA_STICKY_SECONDS: khi đó đọc từ primary để đảm bảo đọc được
+        dữ liệu vừa ghi (read-your-writes).
+        """
+        if not self._replica_cycle:
+            return self.pool
+        last_write = self._last_write
+        if last_write is not None and time.monotonic() - last_write < settings.get_replica_sticky_seconds():
+            return self.pool
+        return next(self._replica_cycle)
+    
+    def bind_request_scope(self, scope: RequestScope):
+        """Gắn scope vào context hiện tại (gọi trong task của request)"""
+        _request_scope.set(scope)
+    
+    def _checkout(self, pool: ConnectionPool):
+        """Lấy connection từ pool; replica lỗi kết nối thì chuyển sang primary"""
+        try:
+            return pool, pool.getconn()
+        except psycopg2.OperationalError as e:
+            if pool is self.pool:
+                raise
+            logger.warning(f"Replica unavailable, falling back to primary: {e}")
+            return self.pool, self.pool.getconn()
+    
     @contextmanager
-    def get_connection(self):
-        """Context manager để lấy connection từ pool"""
+    def get_connection(self, readonly: bool = False, scoped: bool = True):
+        """Context manager để lấy connection từ pool (replica nếu readonly).
+        
+        Trong một request có request_scope, connection của request được dùng
+        lại thay vì checkout từ pool cho mỗi câu lệnh (scoped=False để bỏ qua).
+        """
+        pinned = _transaction_conn.get()
+        if pinned is not None:
+            # Đang trong db.transaction(): dùng lại connection đã ghim,
+            # commit/rollback do transaction() đảm nhận
+            yield pinned
+            return
+        
+        scope = _request_scope.get()
+        if scoped and scope is not None and not scope.closed:
+            conn = scope.acquire(readonly)
+            try:
+                yield conn
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Database error: {e}")
+                raise
+            return
+        
+        pool = self._read_pool() if readonly else self.pool
         conn = None
         try:
-            conn = self.pool.getconn()
+            pool, conn = self._checkout(pool)
             yield conn
         except Exception as e:
             if conn:
@@ -45,50 +664,228 @@ class Database:
             raise
         finally:
             if conn:
-                self.pool.putconn(conn)
+                pool.putconn(conn)
+    
+    @contextmanager
+    def transaction(self):
+        """Unit of work: mọi lệnh db.execute_* bên trong block dùng chung
+        một connection và chỉ commit một lần khi thoát block (rollback nếu lỗi).
+        
+        Transaction lồng nhau sẽ nhập vào transaction ngoài cùng.
+        """
+        if _transaction_conn.get() is not None:
+            yield
+            return
+        
+        with self.get_connection() as conn:
+            token = _transaction_conn.set(conn)
+            try:
+                yield
+            finally:
+                _transaction_conn.reset(token)
+            conn.commit()
+            self._mark_write()
+    
+    def _commit(self, conn):
+        """Commit nếu không nằm trong db.transaction()"""
+        if _transaction_conn.get() is not conn:
+            conn.commit()
+            self._mark_write()
+    
+    def _execute(self, cursor, query: str, params: tuple = None, label: str = None):
+        """cursor.execute() kèm ghi thời gian/số dòng vào query stats"""
+        start = time.perf_counter()
+        try:
+            cursor.execute(query, params)
+        except Exception:
+            self.queries.record(label or query, time.perf_counter() - start, error=True)
+            raise
+        self.queries.record(label or query, time.perf_counter() - start, max(cursor.rowcount, 0))
     
     def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
         """Thực thi query và trả về kết quả"""
-        with self.get_connection() as conn:
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                cursor.execute(query, params)
-                if query.strip().upper().startswith('SELECT'):
-                    return cursor.fetchall()
-                conn.commit()
-                return []
+        readonly = _is_read_query(query)
+        with self.get_connection(readonly=readonly) as conn:
+            with conn.cursor() as cursor:
+                self._execute(cursor, query, params)
+                # SELECT hoặc INSERT/UPDATE/DELETE ... RETURNING thì trả về các dòng
+                results = _fetch_all(cursor) if cursor.description is not None else []
+                if not (readonly or query.strip().upper().startswith('SELECT')):
+                    self._commit(conn)
+                return results
+    
+    def stream_query(self, query: str, params: tuple = None,
+                     itersize: int = None) -> Generator[Dict[str, Any], None, None]:
+        """Generator trả về từng dòng kết quả qua server-side cursor (named cursor).
+        
+        Mỗi lần chỉ fetch `itersize` dòng từ server nên bộ nhớ không phụ thuộc
+        vào số dòng. Connection được giữ cho tới khi generator chạy hết hoặc
+        bị close(), vì vậy phải tiêu thụ hết hoặc đóng generator.
+        """
+        itersize = itersize or settings.get_db_stream_itersize()
+        # Không dùng connection của request: cursor có thể còn mở sau khi request kết thúc
+        with self.get_connection(readonly=True, scoped=False) as conn:
+            cursor_name = f"stream_{uuid.uuid4().hex}"
+            with conn.cursor(name=cursor_name) as cursor:
+                # Chỉ tính thời gian nằm trong database (DECLARE + các lần FETCH),
+                # không tính thời gian bên tiêu thụ generator
+                elapsed = 0.0
+                rows = 0
+                error = True
+                decoder = None
+                try:
+                    start = time.perf_counter()
+                    cursor.execute(query, params)
+                    elapsed += time.perf_counter() - start
+                    while True:
+                        start = time.perf_counter()
+                        batch = cursor.fetchmany(itersize)
+                        elapsed += time.perf_counter() - start
+                        if not batch:
+                            break
+                        rows += len(batch)
+                        if decoder is None:
+                            # Named cursor chỉ có description sau lần FETCH đầu tiên
+                            decoder = RowDecoder(cursor.description)
+                        for row in batch:
+                            yield decoder.one(row)
+                    error = False
+                finally:
+                    self.queries.record(query, elapsed, rows, error=error)
     
     def execute_many(self, query: str, params_list: List[tuple]) -> None:
         """Thực thi nhiều query cùng lúc"""
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.executemany(query, params_list)
-                conn.commit()
+                start = time.perf_counter()
+                try:
+                    cursor.executemany(query, params_list)
+                except Exception:
+                    self.queries.record(query, time.perf_counter() - start, error=True)
+                    raise
+                self.queries.record(query, time.perf_counter() - start, max(cursor.rowcount, 0))
+                self._commit(conn)
     
     def execute_single(self, query: str, params: tuple = None) -> Dict[str, Any]:
         """Thực thi query và trả về 1 kết quả"""
+        readonly = _is_read_query(query)
+        with self.get_connection(readonly=readonly) as conn:
+            with conn.cursor() as cursor:
+                self._execute(cursor, query, params)
+                # Câu lệnh có trả dòng (SELECT hoặc INSERT/UPDATE/DELETE ... RETURNING):
+                # None nếu không có dòng nào, vd UPDATE ... RETURNING không khớp WHERE
+                result = _fetch_one(cursor) if cursor.description is not None else {}
+                if not (readonly or query.strip().upper().startswith('SELECT')):
+                    self._commit(conn)
+                return result
+    
+    def prepare(self, name: str, query: str):
+        """Đăng ký câu lệnh để dùng qua execute_prepared(); PREPARE thực sự
+        chỉ chạy lần đầu statement được dùng trên mỗi connection."""
+        self.prepared.register(name, query)
+    
+    def _execute_prepared(self, conn, cursor, name: str, params: tuple):
+        sql, param_count = self.prepared.get(name)
+        hit = name in conn.prepared
+        if not hit:
+            cursor.execute(f"PREPARE {name} AS {sql}")
+            conn.prepared.add(name)
+        self.prepared.record(name, hit)
+        if param_count:
+            self._execute(cursor, f"EXECUTE {name} ({', '.join(['%s'] * param_count)})", params, label=sql)
+        else:
+            self._execute(cursor, f"EXECUTE {name}", label=sql)
+    
+    def execute_prepared(self, name: str, params: tuple = None) -> List[Dict[str, Any]]:
+        """Thực thi prepared statement (SELECT) đã đăng ký và trả về tất cả dòng"""
+        with self.get_connection(readonly=True) as conn:
+            with conn.cursor() as cursor:
+                self._execute_prepared(conn, cursor, name, params)
+                return _fetch_all(cursor)
+    
+    def execute_prepared_single(self, name: str, params: tuple = None) -> Optional[Dict[str, Any]]:
+        """Thực thi prepared statement (SELECT) đã đăng ký và trả về 1 dòng"""
+        with self.get_connection(readonly=True) as conn:
+            with conn.cursor() as cursor:
+                self._execute_prepared(conn, cursor, name, params)
+                return _fetch_one(cursor)
+    
+    def execute_values(self, query: str, rows: List[tuple], template: str = None,
+                       fetch: bool = False) -> List[Dict[str, Any]]:
+        """Chèn nhiều dòng bằng một câu lệnh multi-row VALUES (query chứa `VALUES %s`).
+        
+        Với fetch=True trả về các dòng RETURNING theo thứ tự của rows.
+        """
+        if not rows:
+            return []
         with self.get_connection() as conn:
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                logger.info(f"Executing query: {query}")
-                logger.info(f"With params: {params}")
-                cursor.execute(query, params)
-                if query.strip().upper().startswith('SELECT'):
-                    result = cursor.fetchone()
-                    logger.info(f"SELECT result: {result}")
-                    return result
-                elif query.strip().upper().startswith('INSERT'):
-                    conn.commit()
-                    # For INSERT with RETURNING, fetch the result
-                    if 'RETURNING' in query.upper():
-                        result = cursor.fetchone()
-                        logger.info(f"INSERT RETURNING result: {result}")
-                        return result
-                    else:
-                        logger.info("INSERT without RETURNING")
-                        return {}
-                else:
-                    conn.commit()
-                    logger.info("Other query executed")
-                    return {}
+            with conn.cursor() as cursor:
+                start = time.perf_counter()
+                try:
+                    result = psycopg2.extras.execute_values(
+                        cursor, query, rows, template=template, page_size=len(rows), fetch=fetch
+                    )
+                except Exception:
+                    self.queries.record(query, time.perf_counter() - start, error=True)
+                    raise
+                self.queries.record(query, time.perf_counter() - start, len(rows))
+                self._commit(conn)
+                return RowDecoder(cursor.description).all(result) if fetch else []
+    
+    def copy_rows(self, table: str, columns: List[str], rows, returning_ids: bool = False) -> List[int]:
+        """Bulk load bằng COPY ... FROM STDIN.
+        
+        `rows` là iterable các tuple theo thứ tự `columns` (được stream, không
+        materialize) hoặc một file-like object đã chứa dữ liệu COPY text format.
+        Với returning_ids=True, id được cấp trước từ sequence của bảng (một
+        query nextval) rồi COPY kèm cột id; trả về danh sách id theo thứ tự rows.
+        """
+        if returning_ids:
+            if hasattr(rows, 'read'):
+                raise ValueError("returning_ids requires an iterable of rows, not a buffer")
+            rows = list(rows)
+            if not rows:
+                return []
+        
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                ids = []
+                if returning_ids:
+                    self._execute(cursor, """
+                        SELECT nextval(pg_get_serial_sequence(%s, 'id'))
+                        FROM generate_series(1, %s)
+                    """, (table, len(rows)))
+                    ids = [row[0] for row in cursor.fetchall()]
+                    columns = ['id'] + list(columns)
+                    rows = ((row_id,) + tuple(row) for row_id, row in zip(ids, rows))
+                
+                copy_sql = sql.SQL("COPY {} ({}) FROM STDIN").format(
+                    sql.Identifier(table),
+                    sql.SQL(', ').join(map(sql.Identifier, columns))
+                ).as_string(conn)
+                source = rows if hasattr(rows, 'read') else _CopyRowsReader(rows)
+                
+                start = time.perf_counter()
+                try:
+                    cursor.copy_expert(copy_sql, source)
+                except Exception:
+                    self.queries.record(copy_sql, time.perf_counter() - start, error=True)
+                    raise
+                self.queries.record(copy_sql, time.perf_counter() - start, max(cursor.rowcount, 0))
+                self._commit(conn)
+                return ids
+    
+    async def execute_query_async(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
+        """Phiên bản async của execute_query"""
+        return await self.run(self.execute_query, query, params)
+    
+    async def execute_many_async(self, query: str, params_list: List[tuple]) -> None:
+        """Phiên bản async của execute_many"""
+        return await self.run(self.execute_many, query, params_list)
+    
+    async def execute_single_async(self, query: str, params: tuple = None) -> Dict[str, Any]:
+        """Phiên bản async của execute_single"""
+        return await self.run(self.execute_single, query, params)
 
 # Global database instance
 db = Database() 
\ No newline at end of file
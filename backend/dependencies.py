@@ -0,0 +1,22 @@
+import asyncio
+from fastapi import Request
+from .database import db, RequestScope
+
+async def request_scope(request: Request):
+    """FastAPI dependency: mỗi request chỉ checkout connection database một lần.
+    
+    Mọi lệnh db.* trong request (kể cả qua db.run, vì contextvars được copy
+    sang worker thread) dùng chung connection này; connection được trả về
+    pool khi request kết thúc. Connection chỉ được checkout khi request chạy
+    lệnh database đầu tiên: route chỉ stream qua connection riêng (export)
+    không giữ thêm connection trong suốt lúc stream.
+    """
+    scope = RequestScope(db, readonly=request.method in ("GET", "HEAD"))
+    db.bind_request_scope(scope)
+    try:
+        yield scope
+    finally:
+        if scope.idle:
+            scope.release()
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, scope.release)
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
+import asyncio
 import logging
 import os
 
 from .config import settings
 from .database import db
+from .dependencies import request_scope
+from .models.question import Question, question_cache, subject_stats_cache
 from .routes import auth_router, subjects_router, questions_router, exams_router, import_router
 
 # Configure logging
@@ -35,12 +38,20 @@ app.add_middleware(
 if os.path.exists(settings.get_images_dir()):
     app.mount("/images", StaticFiles(directory=settings.get_images_dir()), name="images")
 
-# Include routers
-app.include_router(auth_router)
-app.include_router(subjects_router)
-app.include_router(questions_router)
-app.include_router(exams_router)
-app.include_router(import_router)
+# Include routers (mỗi request dùng chung một connection database)
+for router in (auth_router, subjects_router, questions_router, exams_router, import_router):
+    app.include_router(router, dependencies=[Depends(request_scope)])
+
+async def purge_deleted_questions():
+    """Tác vụ nền: định kỳ xóa hẳn các câu hỏi đã xóa mềm (một câu lệnh DELETE mỗi lần)"""
+    interval = settings.get_question_purge_interval_seconds()
+    retention = settings.get_question_purge_retention_seconds()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db.run(Question.purge_deleted, retention)
+        except Exception as e:
+            logger.error(f"Failed to purge deleted questions: {e}")
 
 @app.on_event("startup")
 async def startup_event():
@@ -51,10 +62,16 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to connect to database: {e}")
         raise
+    
+    if settings.get_question_purge_interval_seconds() > 0:
+        app.state.purge_task = asyncio.create_task(purge_deleted_questions())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Đóng database connection khi app shutdown"""
+    purge_task = getattr(app.state, 'purge_task', None)
+    if purge_task:
+        purge_task.cancel()
     try:
         db.close()
         logger.info("Database connection closed")
@@ -75,12 +92,25 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Test database connection
-        db.execute_query("SELECT 1")
+        await db.execute_query_async("SELECT 1")
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=500, detail="Health check failed")
 
+@app.get("/metrics")
+async def metrics():
+    """Thống kê runtime của database (connection pool) và các cache trong process"""
+    return {
+        "pool": db.pool_stats(),
+        "prepared_statements": db.prepared_stats(),
+        "queries": db.query_stats(),
+        "caches": {
+            "questions": question_cache.stats(),
+            "subject_stats": subject_stats_cache.stats()
+        }
+    }
+
 if __name__ == "__main__":
     uvicorn.run(
         "backend.main:app",
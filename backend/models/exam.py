@@ -1,10 +1,18 @@
 from typing import List, Dict, Any, Optional
 import json
 import random
-from datetime import datetime
 from ..database import db
 
+# Field có thể chọn qua ?fields= của danh sách exam; version_count được đếm trong SQL
+EXAM_LIST_FIELDS = ['id', 'subject_id', 'code', 'title', 'duration_minutes', 'num_questions',
+                    'generated_by', 'created_at', 'subject_name', 'version_count']
+# Đủ cho bảng danh sách đề thi của ExamView
+EXAM_SUMMARY_FIELDS = ['id', 'subject_id', 'code', 'subject_name', 'duration_minutes', 'num_questions', 'created_at']
+
 class ExamVersionQuestion:
+    # __slots__: không có __dict__ cho từng instance, giảm bộ nhớ khi đọc nhiều version
+    __slots__ = ('id', 'exam_version_id', 'question_id', 'choice_order_json')
+    
     def __init__(self, id: int, exam_version_id: int, question_id: int, choice_order_json: str):
         self.id = id
         self.exam_version_id = exam_version_id
@@ -20,6 +28,8 @@ class ExamVersionQuestion:
         }
 
 class ExamVersion:
+    __slots__ = ('id', 'exam_id', 'version_code', 'shuffle_seed', 'is_active', 'created_at', 'questions')
+    
     def __init__(self, id: int, exam_id: int, version_code: str, shuffle_seed: int, 
                  is_active: bool, created_at: str):
         self.id = id
@@ -41,31 +51,34 @@ class ExamVersion:
                 INSERT INTO exam_versions (exam_id, version_code, shuffle_seed)
                 VALUES (%s, %s, %s) RETURNING *
             """
-            result = db.execute_single(query, (exam_id, version_code, shuffle_seed))
-            
-            if result:
-                # Convert datetime to string if needed
-                if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                    result['created_at'] = result['created_at'].isoformat()
+            with db.transaction():
+                result = db.execute_single(query, (exam_id, version_code, shuffle_seed))
+                
+                if not result:
+                    return None
                 
                 exam_version = ExamVersion(**result)
                 
-                # Insert questions với shuffled choices
+                # Lấy tất cả question (kèm choices) bằng một lần gọi thay vì từng câu
+                from .question import Question
+                questions_by_id = {question.id: question for question in Question.get_by_ids(questions)}
+                
+                # Tính thứ tự choices đã shuffle cho từng question
+                evq_rows = []
                 for question_id in questions:
-                    # Lấy question và choices
-                    from .question import Question, Choice
-                    question = Question.get_by_id(question_id)
-                    choices = Choice.get_by_question_id(question_id)
+                    question = questions_by_id.get(question_id)
+                    choices = question.choices if question else []
                     
                     if not question or not choices:
                         continue
                     
                     # Chỉ shuffle nếu mix_choice = true
                     if question.mix_choices:
-                        # Shuffle choices với seed
-                        random.seed(shuffle_seed + question_id)
+                        # Shuffle choices với seed; RNG riêng thay vì random toàn cục,
+                        # vì nhiều request chạy song song trên các thread của db.executor
+                        rng = random.Random(shuffle_seed + question_id)
                         shuffled_choices = choices.copy()
-                        random.shuffle(shuffled_choices)
+                        rng.shuffle(shuffled_choices)
                         
                         # Lưu thứ tự mới
                         choice_order = [choice.id for choice in shuffled_choices]
@@ -75,17 +88,20 @@ class ExamVersion:
                         choice_order = [choice.id for choice in choices]
                         choice_order_json = json.dumps(choice_order)
                     
-                    # Insert vào exam_version_questions
-                    evq_query = """
-                        INSERT INTO exam_version_questions (exam_version_id, question_id, choice_order_json)
-                        VALUES (%s, %s, %s) RETURNING *
-                    """
-                    evq_result = db.execute_single(evq_query, (exam_version.id, question_id, choice_order_json))
-                    if evq_result:
-                        exam_version.questions.append(ExamVersionQuestion(**evq_result))
+                    evq_rows.append((exam_version.id, question_id, choice_order_json))
                 
-                return exam_version
-            return None
+                # Bulk load vào exam_version_questions bằng COPY
+                evq_ids = db.copy_rows(
+                    'exam_version_questions',
+                    ['exam_version_id', 'question_id', 'choice_order_json'],
+                    evq_rows,
+                    returning_ids=True
+                )
+                exam_version.questions = [
+                    ExamVersionQuestion(evq_id, *evq_row) for evq_id, evq_row in zip(evq_ids, evq_rows)
+                ]
+            
+            return exam_version
         except Exception as e:
             print(f"Error creating exam version: {e}")
             raise
@@ -106,18 +122,24 @@ class ExamVersion:
     
     def get_questions_with_shuffled_choices(self) -> List[Dict[str, Any]]:
         """Lấy questions với choices đã được shuffle"""
-        from .question import Question, Choice
+        from .question import Question
+        
+        # Lấy tất cả question (kèm choices gốc) của version bằng một lần gọi
+        questions_by_id = {
+            question.id: question
+            for question in Question.get_by_ids([evq.question_id for evq in self.questions], include_deleted=True)
+        }
         
         questions_data = []
         
         for evq in self.questions:
             # Lấy question
-            question = Question.get_by_id(evq.question_id)
+            question = questions_by_id.get(evq.question_id)
             if not question:
                 continue
             
             # Lấy choices gốc
-            original_choices = Choice.get_by_question_id(question.id)
+            original_choices = question.choices
             
             # Parse shuffled order
             try:
@@ -155,22 +177,20 @@ class ExamVersion:
         return questions_data
     
     def to_dict(self) -> Dict[str, Any]:
-        # Convert datetime to string if it's a datetime object
-        created_at = self.created_at
-        if isinstance(created_at, datetime):
-            created_at = created_at.isoformat()
-        
         return {
             'id': self.id,
             'exam_id': self.exam_id,
             'version_code': self.version_code,
             'shuffle_seed': self.shuffle_seed,
             'is_active': self.is_active,
-            'created_at': created_at,
+            'created_at': self.created_at,
             'questions': [q.to_dict() for q in self.questions]
         }
 
 class Exam:
+    __slots__ = ('id', 'subject_id', 'code', 'title', 'duration_minutes', 'num_questions',
+                 'generated_by', 'created_at', 'subject_name', 'versions')
+    
     def __init__(self, id: int, subject_id: int, code: str, title: str, 
                  duration_minutes: int, num_questions: int, generated_by: int, created_at: str, 
                  subject_name: str = None):
@@ -195,12 +215,12 @@ class Exam:
                 INSERT INTO exams (subject_id, code, title, duration_minutes, num_questions, generated_by)
                 VALUES (%s, %s, %s, %s, %s, %s) RETURNING *
             """
-            result = db.execute_single(query, (subject_id, code, title, duration_minutes, num_questions, generated_by))
-            
-            if result:
-                # Convert datetime to string if needed
-                if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                    result['created_at'] = result['created_at'].isoformat()
+            # Exam và version đầu tiên được tạo trong cùng một transaction
+            with db.transaction():
+                result = db.execute_single(query, (subject_id, code, title, duration_minutes, num_questions, generated_by))
+                
+                if not result:
+                    return None
                 
                 exam = Exam(**result)
                 
@@ -209,9 +229,8 @@ class Exam:
                 exam_version = ExamVersion.create(exam.id, version_code, question_ids)
                 if exam_version:
                     exam.versions.append(exam_version)
-                
-                return exam
-            return None
+            
+            return exam
         except Exception as e:
             print(f"Error creating exam: {e}")
             raise
@@ -228,6 +247,22 @@ class Exam:
         results = db.execute_query(query)
         return [Exam(**result) for result in results]
     
+    @staticmethod
+    def get_all_fields(fields: List[str]) -> List[Dict[str, Any]]:
+        """Như get_all nhưng chỉ SELECT các field yêu cầu (dict, luôn có id)"""
+        fields = ['id'] + [field for field in fields if field != 'id']
+        columns = []
+        for field in fields:
+            if field == 'subject_name':
+                columns.append("s.name AS subject_name")
+            elif field == 'version_count':
+                columns.append("(SELECT COUNT(*) FROM exam_versions v WHERE v.exam_id = e.id) AS version_count")
+            else:
+                columns.append(f"e.{field}")
+        join = "JOIN subjects s ON e.subject_id = s.id" if 'subject_name' in fields else ""
+        query = f"SELECT {', '.join(columns)} FROM exams e {join} ORDER BY e.created_at DESC"
+        return db.execute_query(query)
+    
     @staticmethod
     def get_by_id(exam_id: int) -> Optional['Exam']:
         """Lấy exam theo ID"""
@@ -278,11 +313,6 @@ class Exam:
         return ExamVersion.create(self.id, version_code, question_ids)
     
     def to_dict(self) -> Dict[str, Any]:
-        # Convert datetime to string if it's a datetime object
-        created_at = self.created_at
-        if isinstance(created_at, datetime):
-            created_at = created_at.isoformat()
-        
         return {
             'id': self.id,
             'subject_id': self.subject_id,
@@ -291,7 +321,7 @@ class Exam:
             'duration_minutes': self.duration_minutes,
             'num_questions': self.num_questions,
             'generated_by': self.generated_by,
-            'created_at': created_at,
+            'created_at': self.created_at,
             'subject_name': self.subject_name,
             'versions': [v.to_dict() for v in self.versions] if self.versions else []
         } 
\ No newline at end of file
@@ -1,9 +1,127 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from itertools import groupby
 import logging
+import time
+from ..config import settings
 from ..database import db
+from ..services.similarity import similarity_index, question_document
+from .user_subject import UserSubject
+from ..utils.cache import TTLCache, LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Các cột map vào model; không dùng SELECT * để không kéo theo cột nội bộ (search_vector)
+QUESTION_COLUMNS = "id, subject_id, unit_text, question, mix_choices, image, mark, created_by, created_at, updated_by, updated_at"
+CHOICE_COLUMNS = "id, question_id, content, is_correct, position, created_at"
+
+# Field có thể chọn qua ?fields= của danh sách câu hỏi; choice_count và question_snippet
+# (QUESTION_SNIPPET_LENGTH ký tự đầu của câu hỏi, thêm "..." nếu dài hơn) được tính trong SQL
+QUESTION_LIST_FIELDS = QUESTION_COLUMNS.split(", ") + ['question_snippet', 'choice_count', 'choices']
+# Đủ cho bảng danh sách của QuestionView: không có toàn văn câu hỏi, nội dung đáp án và cột audit
+QUESTION_SUMMARY_FIELDS = ['id', 'subject_id', 'unit_text', 'question_snippet', 'mark', 'mix_choices', 'choice_count']
+QUESTION_SNIPPET_LENGTH = 50
+
+# Các query nóng được PREPARE một lần trên mỗi connection
+db.prepare('question_by_id', f"SELECT {QUESTION_COLUMNS} FROM questions WHERE id = %s AND deleted_at IS NULL")
+db.prepare('question_by_id_any', f"SELECT {QUESTION_COLUMNS} FROM questions WHERE id = %s")
+db.prepare('choices_by_question', f"SELECT {CHOICE_COLUMNS} FROM choices WHERE question_id = %s ORDER BY position")
+
+# Thống kê ngân hàng câu hỏi theo subject_id; xóa khi có ghi vào câu hỏi của môn
+subject_stats_cache = TTLCache(settings.get_subject_stats_cache_seconds())
+
+# Toàn bộ câu hỏi (kèm choices, sắp theo id) của từng môn, LRU giới hạn theo tổng số câu hỏi.
+# Các object trong cache dùng chung giữa các request: chỉ đọc, không sửa trực tiếp
+question_cache = LRUCache(settings.get_question_cache_max_questions(), size_of=lambda questions: max(len(questions), 1))
+
+# Thời điểm (time.monotonic()) mỗi môn bị invalidate lần cuối
+_invalidated_at: Dict[int, float] = {}
+
+def _invalidate_subjects(subject_ids):
+    """Bỏ cache câu hỏi và thống kê của các môn vừa có thay đổi"""
+    subject_ids = set(subject_ids)
+    now = time.monotonic()
+    for subject_id in subject_ids:
+        _invalidated_at[subject_id] = now
+    question_cache.invalidate(subject_ids)
+    subject_stats_cache.invalidate(subject_ids)
+
+def _cacheable(subject_id: int) -> bool:
+    """Kết quả vừa đọc của môn có được đưa vào cache không.
+    
+    Đọc có thể đi qua replica (connection của request), mà replica có thể chưa thấy
+    lệnh ghi vừa invalidate môn: trong REPLICA_STICKY_SECONDS sau lần invalidate
+    thì không cache, request vẫn dùng kết quả vừa đọc.
+    """
+    if not db.replicas:
+        return True
+    invalidated_at = _invalidated_at.get(subject_id)
+    return invalidated_at is None or time.monotonic() - invalidated_at >= settings.get_replica_sticky_seconds()
+
+def _filter_questions(questions, after_id=None, limit=None, unit_text=None, mark=None, mix_choices=None):
+    """Áp dụng filter / phân trang của get_all lên danh sách đã sắp theo id"""
+    filtered = [
+        question for question in questions
+        if (after_id is None or question.id > after_id)
+        and (unit_text is None or question.unit_text == unit_text)
+        and (mark is None or question.mark == mark)
+        and (mix_choices is None or question.mix_choices == mix_choices)
+    ]
+    return filtered[:limit] if limit is not None else filtered
+
+def _list_query(columns: str, subject_id=None, subject_ids=None, after_id=None, limit=None,
+                unit_text=None, mark=None, mix_choices=None, user_id=None) -> Tuple[str, Optional[tuple]]:
+    """Query danh sách câu hỏi (filter + keyset pagination theo id) chọn các cột `columns`.
+    
+    Có user_id thì giới hạn trong các môn user xem được ngay trong câu lệnh.
+    """
+    # Câu hỏi đã xóa mềm không bao giờ xuất hiện trong danh sách
+    conditions = ["deleted_at IS NULL"]
+    params = []
+    if subject_id:
+        conditions.append("subject_id = %s")
+        params.append(subject_id)
+    elif subject_ids is not None:
+        conditions.append("subject_id = ANY(%s)")
+        params.append(list(subject_ids))
+    if user_id:
+        acl_condition, acl_params = UserSubject.acl_filter(user_id)
+        conditions.append(acl_condition)
+        params.extend(acl_params)
+    if unit_text is not None:
+        conditions.append("unit_text = %s")
+        params.append(unit_text)
+    if mark is not None:
+        conditions.append("mark = %s")
+        params.append(mark)
+    if mix_choices is not None:
+        conditions.append("mix_choices = %s")
+        params.append(mix_choices)
+    if after_id is not None:
+        conditions.append("id > %s")
+        params.append(after_id)
+    
+    query = f"SELECT {columns} FROM questions WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, tuple(params) or None
+
+def _project(question: 'Question', fields: List[str]) -> Dict[str, Any]:
+    """Dict chỉ gồm các field yêu cầu của một question đã có choices"""
+    data = {}
+    for field in fields:
+        if field == 'choices':
+            data[field] = [choice.to_dict() for choice in question.choices]
+        elif field == 'choice_count':
+            data[field] = len(question.choices)
+        elif field == 'question_snippet':
+            text = question.question or ''
+            data[field] = text[:QUESTION_SNIPPET_LENGTH] + "..." if len(text) > QUESTION_SNIPPET_LENGTH else text
+        else:
+            data[field] = getattr(question, field)
+    return data
+
 # Helper to normalize image values to SQL NULL
 def _normalize_image_value(image: Optional[str]) -> Optional[str]:
     """Return None (SQL NULL) for empty/placeholder values, else trimmed name."""
@@ -16,7 +134,38 @@ def _normalize_image_value(image: Optional[str]) -> Optional[str]:
         return trimmed
     return None
 
+def _validate_choices(choices: List[Dict[str, Any]]):
+    """Kiểm tra danh sách choices của một câu hỏi, raise ValueError nếu không hợp lệ"""
+    # Validate choices
+    if not choices or len(choices) < 2:
+        raise ValueError("Question must have at least 2 choices")
+    
+    # Check if there's at least one correct answer
+    has_correct_answer = any(choice.get('is_correct', False) for choice in choices)
+    if not has_correct_answer:
+        raise ValueError("Question must have at least one correct answer")
+    
+    # Check if there's only one correct answer
+    correct_answers = [choice for choice in choices if choice.get('is_correct', False)]
+    if len(correct_answers) > 1:
+        raise ValueError("Multiple correct answers detected. Please ensure only one choice is marked as correct.")
+    
+    # Check if all choices have content
+    empty_choices = []
+    for i, choice in enumerate(choices):
+        if not choice.get('content', '').strip():
+            empty_choices.append(i + 1)
+    
+    if empty_choices:
+        if len(empty_choices) == 1:
+            raise ValueError(f"Choice {empty_choices[0]} cannot be empty")
+        else:
+            raise ValueError(f"Choices {', '.join(map(str, empty_choices))} cannot be empty")
+
 class Choice:
+    # __slots__: không có __dict__ cho từng instance, giảm bộ nhớ khi liệt kê nhiều câu hỏi
+    __slots__ = ('id', 'question_id', 'content', 'is_correct', 'position', 'created_at')
+    
     def __init__(self, id: int, question_id: int, content: str, is_correct: bool, position: int, created_at: str):
         self.id = id
         self.question_id = question_id
@@ -36,6 +185,9 @@ class Choice:
         }
 
 class Question:
+    __slots__ = ('id', 'subject_id', 'unit_text', 'question', 'mix_choices', 'image', 'mark',
+                 'created_by', 'created_at', 'updated_by', 'updated_at', 'choices')
+    
     def __init__(self, id: int, subject_id: int, unit_text: str, question: str, 
                  mix_choices: int, image: str, mark: float, created_by: int, 
                  created_at: str, updated_by: int = None, updated_at: str = None):
@@ -49,44 +201,110 @@ class Question:
         self.created_by = created_by
         self.created_at = created_at
         self.updated_by = updated_by
-        # Convert updated_at to string if it's a datetime object
-        if updated_at and hasattr(updated_at, 'isoformat'):
-            self.updated_at = updated_at.isoformat()
-        else:
-            self.updated_at = updated_at
+        self.updated_at = updated_at
         self.choices = []
     
     @staticmethod
-    def get_all(subject_id: Optional[int] = None) -> List['Question']:
-        """Lấy tất cả questions, có thể filter theo subject"""
-        try:
-            if subject_id:
-                query = """
-                    SELECT * FROM questions 
-                    WHERE subject_id = %s 
-                    ORDER BY id
-                """
-                results = db.execute_query(query, (subject_id,))
+    def get_all(subject_id: Optional[int] = None, subject_ids: Optional[List[int]] = None,
+                after_id: Optional[int] = None, limit: Optional[int] = None,
+                unit_text: Optional[str] = None, mark: Optional[float] = None,
+                mix_choices: Optional[int] = None, user_id: Optional[int] = None) -> List['Question']:
+        """Lấy questions, có thể filter theo subject (hoặc danh sách subject),
+        unit_text, mark, mix_choices; user_id giới hạn trong các môn user xem được.
+        
+        Phân trang keyset theo id: trang tiếp theo bắt đầu sau `after_id` (id cuối
+        của trang trước), nên chi phí mỗi trang không phụ thuộc kích thước ngân hàng câu hỏi.
+        Lấy cả một môn thì đọc qua cache của môn (xem get_subject_questions); có
+        phân trang/filter thì chỉ dùng cache khi môn đã có sẵn, không nạp cả môn.
+        """
+        filters = dict(after_id=after_id, limit=limit, unit_text=unit_text, mark=mark, mix_choices=mix_choices)
+        if subject_id and not user_id:
+            if any(value is not None for value in filters.values()):
+                questions = question_cache.get(subject_id)
             else:
-                query = "SELECT * FROM questions ORDER BY id"
-                results = db.execute_query(query)
+                questions = Question.get_subject_questions(subject_id)
+            if questions is not None:
+                return _filter_questions(questions, **filters)
+        return Question._query_all(subject_id, subject_ids, user_id=user_id, **filters)
+    
+    @staticmethod
+    def get_subject_questions(subject_id: int) -> Optional[List['Question']]:
+        """Toàn bộ câu hỏi (kèm choices) của một môn, qua question_cache.
+        
+        Trả về None khi cache tắt, môn có nhiều câu hỏi hơn giới hạn cache hoặc môn
+        vừa có thay đổi (xem _cacheable); khi đó người gọi query thẳng database.
+        Kết quả dùng chung: không được sửa.
+        """
+        if question_cache.max_size <= 0:
+            return None
+        if subject_id not in question_cache:
+            if not _cacheable(subject_id):
+                return None
+            # Không nạp cả môn vào bộ nhớ nếu chắc chắn không vừa cache
+            stats = Question.get_subject_stats(subject_id)
+            if stats is None or stats['total_questions'] > question_cache.max_size:
+                return None
+        # Nạp trên connection của request (cùng routing với thống kê ở trên); có ghi
+        # xen giữa lúc nạp thì get_or_load không lưu kết quả
+        return question_cache.get_or_load(subject_id, lambda: Question._query_all(subject_id))
+    
+    @staticmethod
+    def get_all_fields(fields: List[str], subject_id: Optional[int] = None,
+                       subject_ids: Optional[List[int]] = None, user_id: Optional[int] = None,
+                       **filters) -> List[Dict[str, Any]]:
+        """Như get_all nhưng chỉ trả về các field yêu cầu (dict, luôn có id).
+        
+        Chỉ SELECT các cột cần; choice_count và question_snippet tính trong SQL,
+        choices chỉ được tải khi có trong fields.
+        Môn đã có sẵn trong cache thì lấy từ cache, nhưng không nạp cả môn vào cache.
+        """
+        fields = ['id'] + [field for field in fields if field != 'id']
+        if subject_id and not user_id:
+            questions = question_cache.get(subject_id)
+            if questions is not None:
+                return [_project(question, fields) for question in _filter_questions(questions, **filters)]
+        
+        columns = [field for field in fields if field not in ('question_snippet', 'choice_count', 'choices')]
+        if 'question_snippet' in fields:
+            columns.append(
+                f"CASE WHEN LENGTH(question) > {QUESTION_SNIPPET_LENGTH} "
+                f"THEN LEFT(question, {QUESTION_SNIPPET_LENGTH}) || '...' ELSE question END AS question_snippet"
+            )
+        if 'choice_count' in fields:
+            columns.append("(SELECT COUNT(*) FROM choices c WHERE c.question_id = questions.id) AS choice_count")
+        query, params = _list_query(", ".join(columns), subject_id, subject_ids, user_id=user_id, **filters)
+        results = db.execute_query(query, params)
+        
+        if 'choices' in fields:
+            choices_by_question = Choice.get_by_question_ids([result['id'] for result in results])
+            for result in results:
+                result['choices'] = [choice.to_dict() for choice in choices_by_question.get(result['id'], [])]
+        return [{field: result[field] for field in fields} for result in results]
+    
+    @staticmethod
+    def _query_all(subject_id: Optional[int] = None, subject_ids: Optional[List[int]] = None,
+                   after_id: Optional[int] = None, limit: Optional[int] = None,
+                   unit_text: Optional[str] = None, mark: Optional[float] = None,
+                   mix_choices: Optional[int] = None, user_id: Optional[int] = None) -> List['Question']:
+        """get_all đọc thẳng từ database"""
+        try:
+            query, params = _list_query(QUESTION_COLUMNS, subject_id, subject_ids, after_id, limit,
+                                        unit_text, mark, mix_choices, user_id)
+            results = db.execute_query(query, params)
             
             questions = []
             for result in results:
                 try:
-                    # Convert datetime to string if needed
-                    if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                        result['created_at'] = result['created_at'].isoformat()
-                    if 'updated_at' in result and result['updated_at'] and hasattr(result['updated_at'], 'isoformat'):
-                        result['updated_at'] = result['updated_at'].isoformat()
-                    
-                    question = Question(**result)
-                    question.choices = Choice.get_by_question_id(question.id)
-                    questions.append(question)
+                    questions.append(Question(**result))
                 except Exception as e:
                     logger.error(f"Error processing question {result.get('id', 'unknown')}: {e}")
                     continue
             
+            # Lấy choices của tất cả questions trong một query thay vì một query mỗi question
+            choices_by_question = Choice.get_by_question_ids([question.id for question in questions])
+            for question in questions:
+                question.choices = choices_by_question.get(question.id, [])
+            
             return questions
         except Exception as e:
             logger.error(f"Error in get_all: {e}")
@@ -96,21 +314,134 @@ class Question:
                 raise ValueError(f"Failed to load questions: {str(e)}")
     
     @staticmethod
-    def check_duplicate_question(subject_id: int, question_text: str) -> bool:
-        """Kiểm tra xem câu hỏi đã tồn tại trong subject chưa"""
+    def iter_all(subject_id: Optional[int] = None) -> Iterator['Question']:
+        """Duyệt questions (kèm choices) theo dạng stream, bộ nhớ không phụ thuộc số câu hỏi.
+        
+        Questions và choices được đọc trong một query (LEFT JOIN, sắp theo id)
+        qua server-side cursor, rồi gom các dòng liên tiếp của cùng một question.
+        """
+        question_columns = ", ".join(f"q.{column}" for column in QUESTION_COLUMNS.split(", "))
+        query = """
+            SELECT {question_columns},
+                   c.id AS choice_id, c.content AS choice_content,
+                   c.is_correct AS choice_is_correct, c.position AS choice_position,
+                   c.created_at AS choice_created_at
+            FROM questions q
+            LEFT JOIN choices c ON c.question_id = q.id
+            {where}
+            ORDER BY q.id, c.position
+        """
+        if subject_id:
+            rows = db.stream_query(
+                query.format(question_columns=question_columns, where="WHERE q.deleted_at IS NULL AND q.subject_id = %s"),
+                (subject_id,)
+            )
+        else:
+            rows = db.stream_query(query.format(question_columns=question_columns, where="WHERE q.deleted_at IS NULL"))
+        
+        for _, group in groupby(rows, key=lambda row: row['id']):
+            question = None
+            for row in group:
+                if question is None:
+                    data = {key: value for key, value in row.items() if not key.startswith('choice_')}
+                    question = Question(**data)
+                if row['choice_id'] is not None:
+                    question.choices.append(Choice(
+                        id=row['choice_id'],
+                        question_id=row['id'],
+                        content=row['choice_content'],
+                        is_correct=row['choice_is_correct'],
+                        position=row['choice_position'],
+                        created_at=row['choice_created_at']
+                    ))
+            yield question
+    
+    @staticmethod
+    def search(text: str, subject_id: Optional[int] = None, subject_ids: Optional[List[int]] = None,
+               limit: int = 50, user_id: Optional[int] = None) -> List[Tuple['Question', float]]:
+        """Tìm kiếm full-text trên nội dung câu hỏi và choices, sắp theo độ liên quan.
+        user_id giới hạn trong các môn user xem được.
+        
+        Dùng cột search_vector (config 'simple' + unaccent, nên gõ không dấu vẫn
+        khớp tiếng Việt có dấu) và GIN index; điểm khớp ở choices có trọng số thấp hơn.
+        """
         try:
-            # Normalize question text for comparison (remove extra spaces, lowercase)
-            normalized_text = ' '.join(question_text.strip().lower().split())
+            conditions = ["q.deleted_at IS NULL"]
+            scope_params = []
+            if subject_id:
+                conditions.append("q.subject_id = %s")
+                scope_params.append(subject_id)
+            elif subject_ids is not None:
+                conditions.append("q.subject_id = ANY(%s)")
+                scope_params.append(list(subject_ids))
+            if user_id:
+                acl_condition, acl_params = UserSubject.acl_filter(user_id, "q.subject_id")
+                conditions.append(acl_condition)
+                scope_params.extend(acl_params)
+            scope = "".join(f" AND {condition}" for condition in conditions)
+            question_columns = ", ".join(f"q.{column}" for column in QUESTION_COLUMNS.split(", "))
+            
+            query = f"""
+                WITH query AS (
+                    SELECT websearch_to_tsquery('simple', f_unaccent(%s)) AS tsq
+                ),
+                matches AS (
+                    SELECT q.id, ts_rank(q.search_vector, query.tsq) AS rank
+                    FROM questions q, query
+                    WHERE q.search_vector @@ query.tsq{scope}
+                    UNION ALL
+                    SELECT c.question_id, 0.5 * ts_rank(c.search_vector, query.tsq)
+                    FROM choices c JOIN questions q ON q.id = c.question_id, query
+                    WHERE c.search_vector @@ query.tsq{scope}
+                ),
+                ranked AS (
+                    SELECT id, SUM(rank) AS rank
+                    FROM matches
+                    GROUP BY id
+                    ORDER BY rank DESC, id
+                    LIMIT %s
+                )
+                SELECT {question_columns}, ranked.rank AS search_rank
+                FROM ranked JOIN questions q ON q.id = ranked.id
+                ORDER BY ranked.rank DESC, q.id
+            """
+            results = db.execute_query(query, (text, *scope_params, *scope_params, limit))
             
+            ranked_questions = []
+            for result in results:
+                rank = result.pop('search_rank')
+                ranked_questions.append((Question(**result), rank))
+            
+            choices_by_question = Choice.get_by_question_ids([question.id for question, _ in ranked_questions])
+            for question, _ in ranked_questions:
+                question.choices = choices_by_question.get(question.id, [])
+            
+            return ranked_questions
+        except Exception as e:
+            logger.error(f"Error in search for '{text}': {e}")
+            if "connection" in str(e).lower():
+                raise ValueError("Database connection error. Please try again later.")
+            else:
+                raise ValueError(f"Failed to search questions: {str(e)}")
+    
+    @staticmethod
+    def check_duplicate_question(subject_id: int, question_text: str) -> bool:
+        """Kiểm tra xem câu hỏi đã tồn tại trong subject chưa.
+        
+        So khớp qua cột content_hash (hash của nội dung đã chuẩn hóa, tính bằng
+        cùng hàm SQL question_content_hash) nên dùng được unique index (subject_id, content_hash).
+        """
+        try:
             query = """
-                SELECT COUNT(*) as count 
+                SELECT 1
                 FROM questions 
                 WHERE subject_id = %s 
-                AND LOWER(TRIM(question)) = %s
+                AND content_hash = question_content_hash(%s)
+                AND deleted_at IS NULL
             """
-            result = db.execute_single(query, (subject_id, normalized_text))
+            result = db.execute_single(query, (subject_id, question_text))
             
-            if result and result.get('count', 0) > 0:
+            if result:
                 logger.info(f"Duplicate question found in subject {subject_id}: {question_text[:50]}...")
                 return True
             
@@ -120,18 +451,31 @@ class Question:
             return False
     
     @staticmethod
-    def get_by_id(question_id: int) -> Optional['Question']:
-        """Lấy question theo ID"""
+    def _content_hash_check(subject_ids: List[int], question_texts: List[str]) -> List[Dict[str, Any]]:
+        """Với từng (subject_id, question_text): content_hash và câu hỏi đã có trong subject chưa (một query)"""
+        query = """
+            SELECT t.ord, question_content_hash(t.question) AS content_hash,
+                   EXISTS (
+                       SELECT 1 FROM questions q
+                       WHERE q.subject_id = t.subject_id
+                       AND q.content_hash = question_content_hash(t.question)
+                       AND q.deleted_at IS NULL
+                   ) AS in_subject
+            FROM unnest(%s::int[], %s::text[]) WITH ORDINALITY AS t(subject_id, question, ord)
+            ORDER BY t.ord
+        """
+        return db.execute_query(query, (list(subject_ids), list(question_texts)))
+    
+    @staticmethod
+    def get_by_id(question_id: int, include_deleted: bool = False) -> Optional['Question']:
+        """Lấy question theo ID.
+        
+        include_deleted=True cho các đề đã sinh (preview/version) vẫn cần câu hỏi đã xóa mềm.
+        """
         try:
-            query = "SELECT * FROM questions WHERE id = %s"
-            result = db.execute_single(query, (question_id,))
+            statement = 'question_by_id_any' if include_deleted else 'question_by_id'
+            result = db.execute_prepared_single(statement, (question_id,))
             if result:
-                # Convert datetime to string if needed
-                if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                    result['created_at'] = result['created_at'].isoformat()
-                if 'updated_at' in result and result['updated_at'] and hasattr(result['updated_at'], 'isoformat'):
-                    result['updated_at'] = result['updated_at'].isoformat()
-                
                 question = Question(**result)
                 question.choices = Choice.get_by_question_id(question.id)
                 return question
@@ -143,6 +487,84 @@ class Question:
             else:
                 raise ValueError(f"Failed to load question {question_id}: {str(e)}")
     
+    @staticmethod
+    def get_by_ids(question_ids: List[int], include_deleted: bool = False) -> List['Question']:
+        """Lấy nhiều question (kèm choices) theo danh sách ID, giữ thứ tự của question_ids"""
+        if not question_ids:
+            return []
+        query = f"SELECT {QUESTION_COLUMNS} FROM questions WHERE id = ANY(%s)"
+        if not include_deleted:
+            query += " AND deleted_at IS NULL"
+        results = db.execute_query(query, (list(question_ids),))
+        questions = {result['id']: Question(**result) for result in results}
+        
+        choices_by_question = Choice.get_by_question_ids(list(questions))
+        for question in questions.values():
+            question.choices = choices_by_question.get(question.id, [])
+        return [questions[question_id] for question_id in question_ids if question_id in questions]
+    
+    @staticmethod
+    def find_similar(question_id: int, threshold: float = 0.6, limit: int = 10) -> List[Tuple['Question', float]]:
+        """Tìm các câu hỏi gần giống (cùng môn) với một câu hỏi, kèm độ giống ước lượng"""
+        question = Question.get_by_id(question_id)
+        if not question:
+            raise ValueError(f"Question {question_id} not found")
+        matches = similarity_index.find_similar(
+            question.similarity_document(),
+            subject_id=question.subject_id,
+            threshold=threshold,
+            limit=limit,
+            exclude_id=question.id
+        )
+        similarity_by_id = dict(matches)
+        return [(similar, similarity_by_id[similar.id]) for similar in Question.get_by_ids(list(similarity_by_id))]
+    
+    @staticmethod
+    def get_subject_stats(subject_id: int) -> Optional[Dict[str, Any]]:
+        """Thống kê câu hỏi của môn: tổng số câu, tổng điểm, số câu theo unit / mark / mix_choices.
+        
+        Một query GROUPING SETS, không tải câu hỏi về; kết quả được cache.
+        Trả về None nếu môn không tồn tại.
+        """
+        stats = subject_stats_cache.get(subject_id)
+        if stats is not None:
+            return stats
+        
+        query = """
+            SELECT unit_text, mark, mix_choices,
+                   GROUPING(unit_text) AS all_units, GROUPING(mark) AS all_marks,
+                   GROUPING(mix_choices) AS all_mix_choices,
+                   COUNT(*) AS question_count, COALESCE(SUM(mark), 0) AS total_mark
+            FROM questions
+            WHERE subject_id = %s AND deleted_at IS NULL
+            GROUP BY GROUPING SETS ((unit_text), (mark), (mix_choices), ())
+        """
+        results = db.execute_query(query, (subject_id,))
+        
+        stats = {'subject_id': subject_id, 'total_questions': 0, 'total_mark': 0.0,
+                 'by_unit': [], 'by_mark': [], 'by_mix_choices': []}
+        for row in results:
+            if not row['all_units']:
+                stats['by_unit'].append({'unit_text': row['unit_text'], 'count': row['question_count'],
+                                         'total_mark': row['total_mark']})
+            elif not row['all_marks']:
+                stats['by_mark'].append({'mark': row['mark'], 'count': row['question_count']})
+            elif not row['all_mix_choices']:
+                stats['by_mix_choices'].append({'mix_choices': row['mix_choices'], 'count': row['question_count']})
+            else:
+                stats['total_questions'] = row['question_count']
+                stats['total_mark'] = row['total_mark']
+        
+        if not stats['total_questions'] and not db.execute_single("SELECT 1 AS found FROM subjects WHERE id = %s", (subject_id,)):
+            return None
+        
+        stats['by_unit'].sort(key=lambda item: (item['unit_text'] is None, item['unit_text'] or ''))
+        stats['by_mark'].sort(key=lambda item: (item['mark'] is None, item['mark'] or 0))
+        stats['by_mix_choices'].sort(key=lambda item: item['mix_choices'])
+        if _cacheable(subject_id):
+            subject_stats_cache.set(subject_id, stats)
+        return stats
+    
     @staticmethod
     def create(subject_id: int, unit_text: str, question: str, mix_choices: int,
                image: str, mark: float, created_by: int, choices: List[Dict[str, Any]]) -> 'Question':
@@ -154,84 +576,157 @@ class Question:
             if Question.check_duplicate_question(subject_id, question):
                 raise ValueError(f"Question already exists in this subject: {question[:100]}...")
             
-            # Validate choices
-            if not choices or len(choices) < 2:
-                raise ValueError("Question must have at least 2 choices")
+            _validate_choices(choices)
             
-            # Check if there's at least one correct answer
-            has_correct_answer = any(choice.get('is_correct', False) for choice in choices)
-            if not has_correct_answer:
-                raise ValueError("Question must have at least one correct answer")
-            
-            # Check if there's only one correct answer
-            correct_answers = [choice for choice in choices if choice.get('is_correct', False)]
-            if len(correct_answers) > 1:
-                raise ValueError("Multiple correct answers detected. Please ensure only one choice is marked as correct.")
-            
-            # Check if all choices have content
-            empty_choices = []
-            for i, choice in enumerate(choices):
-                if not choice.get('content', '').strip():
-                    empty_choices.append(i + 1)
-            
-            if empty_choices:
-                if len(empty_choices) == 1:
-                    raise ValueError(f"Choice {empty_choices[0]} cannot be empty")
-                else:
-                    raise ValueError(f"Choices {', '.join(map(str, empty_choices))} cannot be empty")
-            
-            # Insert question
-            query = """
+            # Insert question + toàn bộ choices trong một transaction (1 lần commit)
+            query = f"""
                 INSERT INTO questions (subject_id, unit_text, question, mix_choices, image, mark, created_by, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, NULL) RETURNING *
+                VALUES (%s, %s, %s, %s, %s, %s, %s, NULL) RETURNING {QUESTION_COLUMNS}
             """
             # Normalize image to SQL NULL if empty-like
             image_value = _normalize_image_value(image)
-            result = db.execute_single(query, (subject_id, unit_text, question, mix_choices, image_value, mark, created_by))
-            
-            if result:
-                logger.info(f"Question created with ID: {result.get('id')}")
+            with db.transaction():
+                result = db.execute_single(query, (subject_id, unit_text, question, mix_choices, image_value, mark, created_by))
                 
-                # Convert datetime to string if needed
-                if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                    result['created_at'] = result['created_at'].isoformat()
-                if 'updated_at' in result and result['updated_at'] and hasattr(result['updated_at'], 'isoformat'):
-                    result['updated_at'] = result['updated_at'].isoformat()
+                if not result:
+                    logger.error("Failed to create question - no result returned")
+                    raise ValueError("Failed to create question. Database returned no result. Please check your input data and try again.")
+                
+                logger.info(f"Question created with ID: {result.get('id')}")
                 
                 question_obj = Question(**result)
                 
-                # Insert choices
-                for i, choice_data in enumerate(choices):
-                    logger.info(f"Creating choice {i+1}: {choice_data}")
-                    choice_query = """
-                        INSERT INTO choices (question_id, content, is_correct, position)
-                        VALUES (%s, %s, %s, %s) RETURNING *
-                    """
-                    choice_result = db.execute_single(choice_query, (
-                        question_obj.id, 
-                        choice_data['content'], 
-                        choice_data['is_correct'], 
-                        i + 1
-                    ))
-                    if choice_result:
-                        # Convert datetime to string if needed
-                        if 'created_at' in choice_result and hasattr(choice_result['created_at'], 'isoformat'):
-                            choice_result['created_at'] = choice_result['created_at'].isoformat()
-                        
-                        question_obj.choices.append(Choice(**choice_result))
-                        logger.info(f"Choice {i+1} created successfully")
-                    else:
-                        logger.error(f"Failed to create choice {i+1}")
-                        raise ValueError(f"Failed to create choice {i+1}. Database error occurred.")
+                # Insert choices bằng một câu lệnh multi-row
+                choice_query = f"""
+                    INSERT INTO choices (question_id, content, is_correct, position)
+                    VALUES %s RETURNING {CHOICE_COLUMNS}
+                """
+                choice_results = db.execute_values(choice_query, [
+                    (question_obj.id, choice_data['content'], choice_data['is_correct'], i + 1)
+                    for i, choice_data in enumerate(choices)
+                ], fetch=True)
+                if len(choice_results) != len(choices):
+                    logger.error(f"Failed to create choices for question {question_obj.id}")
+                    raise ValueError("Failed to create choices. Database error occurred.")
                 
-                return question_obj
-            else:
-                logger.error("Failed to create question - no result returned")
-                raise ValueError("Failed to create question. Database returned no result. Please check your input data and try again.")
+                for choice_result in sorted(choice_results, key=lambda row: row['position']):
+                    question_obj.choices.append(Choice(**choice_result))
+                
+                # Cập nhật chỉ mục near-duplicate trong cùng transaction
+                similarity_index.index_question(question_obj.id, question_obj.similarity_document())
+            
+            _invalidate_subjects([subject_id])
+            return question_obj
                 
         except Exception as e:
             logger.error(f"Error creating question: {str(e)}")
+            # Hai request tạo cùng câu hỏi đồng thời: unique index chặn câu thứ hai
+            if "uq_questions_subject_content_hash" in str(e):
+                raise ValueError(f"Question already exists in this subject: {question[:100]}...")
+            raise
+    
+    @staticmethod
+    def create_many(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Tạo nhiều question (kèm choices) trong một transaction.
+        
+        Mỗi item có các field như tham số của create(), thêm 'signature' (kết quả
+        SimilarityIndex.signature() của question_document, nếu người gọi đã tính) để không
+        phải tính lại khi ghi chỉ mục; chỉ dùng khi mọi item đều có.
+        Các item không hợp lệ hoặc trùng (đã có trong môn / trùng item trước trong lô)
+        bị bỏ qua, các item còn lại được chèn bằng hai câu lệnh multi-row (questions, choices).
+        Trả về kết quả theo thứ tự items: {'index', 'success', 'duplicate', 'error', 'question'}.
+        """
+        results = [
+            {'index': i, 'success': False, 'duplicate': False, 'error': None, 'question': None}
+            for i in range(len(items))
+        ]
+        
+        valid = []
+        for i, item in enumerate(items):
+            try:
+                if not (item.get('question') or '').strip():
+                    raise ValueError("Question text cannot be empty")
+                _validate_choices(item.get('choices'))
+                valid.append(i)
+            except ValueError as e:
+                results[i]['error'] = str(e)
+        if not valid:
+            return results
+        
+        try:
+            # Kiểm tra trùng cho cả lô bằng một query (theo content_hash)
+            hash_checks = Question._content_hash_check(
+                [items[i]['subject_id'] for i in valid], [items[i]['question'] for i in valid]
+            )
+            to_insert = {}
+            for i, check in zip(valid, hash_checks):
+                key = (items[i]['subject_id'], check['content_hash'])
+                if check['in_subject'] or key in to_insert:
+                    results[i]['duplicate'] = True
+                    results[i]['error'] = "Question already exists in this subject"
+                else:
+                    to_insert[key] = i
+            if not to_insert:
+                return results
+            
+            question_query = f"""
+                INSERT INTO questions (subject_id, unit_text, question, mix_choices, image, mark, created_by)
+                VALUES %s
+                ON CONFLICT (subject_id, content_hash) WHERE deleted_at IS NULL DO NOTHING
+                RETURNING {QUESTION_COLUMNS}, content_hash
+            """
+            choice_query = f"""
+                INSERT INTO choices (question_id, content, is_correct, position)
+                VALUES %s RETURNING {CHOICE_COLUMNS}
+            """
+            with db.transaction():
+                question_rows = db.execute_values(question_query, [
+                    (
+                        items[i]['subject_id'], items[i].get('unit_text'), items[i]['question'],
+                        items[i].get('mix_choices', 1), _normalize_image_value(items[i].get('image')),
+                        items[i].get('mark', 1.0), items[i]['created_by']
+                    )
+                    for i in to_insert.values()
+                ], fetch=True)
+                
+                # Map dòng RETURNING về item theo (subject_id, content_hash), không phụ thuộc thứ tự
+                created = {}
+                for row in question_rows:
+                    i = to_insert[(row['subject_id'], row.pop('content_hash'))]
+                    created[i] = Question(**row)
+                
+                choice_rows = db.execute_values(choice_query, [
+                    (question.id, choice_data['content'], choice_data.get('is_correct', False), position + 1)
+                    for i, question in created.items()
+                    for position, choice_data in enumerate(items[i]['choices'])
+                ], fetch=True)
+                questions_by_id = {question.id: question for question in created.values()}
+                for choice_row in sorted(choice_rows, key=lambda row: (row['question_id'], row['position'])):
+                    questions_by_id[choice_row['question_id']].choices.append(Choice(**choice_row))
+                
+                # Cập nhật chỉ mục near-duplicate trong cùng transaction
+                signatures = None
+                if all('signature' in items[i] for i in created):
+                    signatures = [items[i]['signature'] for i in created]
+                similarity_index.index_questions(
+                    [(question.id, question.similarity_document()) for question in created.values()],
+                    signatures
+                )
+        except Exception as e:
+            logger.error(f"Error creating questions in batch: {str(e)}")
             raise
+        
+        _invalidate_subjects(question.subject_id for question in created.values())
+        for i in to_insert.values():
+            if i in created:
+                results[i]['success'] = True
+                results[i]['question'] = created[i]
+            else:
+                # Bị request khác chèn cùng nội dung giữa lúc kiểm tra và lúc INSERT
+                results[i]['duplicate'] = True
+                results[i]['error'] = "Question already exists in this subject"
+        logger.info(f"Created {len(created)} of {len(items)} questions in batch")
+        return results
     
     def update(self, unit_text: str, question: str, mix_choices: int, image: str = None, 
                mark: float = 1.0, updated_by: int = None, choices: List[Dict[str, Any]] = None) -> bool:
@@ -239,83 +734,50 @@ class Question:
         try:
             logger.info(f"Updating question {self.id} with unit_text='{unit_text}', question='{question[:50]}...'")
             
-            # Validate choices
-            if not choices or len(choices) < 2:
-                raise ValueError("Question must have at least 2 choices")
-            
-            # Check if there's at least one correct answer
-            has_correct_answer = any(choice.get('is_correct', False) for choice in choices)
-            if not has_correct_answer:
-                raise ValueError("Question must have at least one correct answer")
+            _validate_choices(choices)
             
-            # Check if there's only one correct answer
-            correct_answers = [choice for choice in choices if choice.get('is_correct', False)]
-            if len(correct_answers) > 1:
-                raise ValueError("Multiple correct answers detected. Please ensure only one choice is marked as correct.")
-            
-            # Check if all choices have content
-            empty_choices = []
-            for i, choice in enumerate(choices):
-                if not choice.get('content', '').strip():
-                    empty_choices.append(i + 1)
-            
-            if empty_choices:
-                if len(empty_choices) == 1:
-                    raise ValueError(f"Choice {empty_choices[0]} cannot be empty")
-                else:
-                    raise ValueError(f"Choices {', '.join(map(str, empty_choices))} cannot be empty")
-            
-            # Update question
-            query = """
+            # Update question + áp dụng diff choices trong một transaction (1 lần commit)
+            query = f"""
                 UPDATE questions 
                 SET unit_text = %s, question = %s, mix_choices = %s, image = %s, 
                     mark = %s, updated_by = %s, updated_at = NOW()
-                WHERE id = %s
+                WHERE id = %s AND deleted_at IS NULL
+                RETURNING {QUESTION_COLUMNS}
             """
             # Normalize image to SQL NULL if empty-like
             image_value = _normalize_image_value(image)
-            db.execute_query(query, (unit_text, question, mix_choices, image_value, mark, updated_by, self.id))
-            
-            # Verify update was successful
-            verify_query = "SELECT id FROM questions WHERE id = %s"
-            result = db.execute_single(verify_query, (self.id,))
-            if not result:
-                logger.error(f"Question {self.id} not found after update")
-                raise ValueError(f"Question {self.id} was not found after update. The question may have been deleted by another user.")
-            
-            # Delete old choices
-            db.execute_query("DELETE FROM choices WHERE question_id = %s", (self.id,))
-            
-            # Insert new choices
-            for i, choice_data in enumerate(choices):
-                choice_query = """
-                    INSERT INTO choices (question_id, content, is_correct, position)
-                    VALUES (%s, %s, %s, %s)
-                """
-                db.execute_query(choice_query, (
-                    self.id, 
-                    choice_data['content'], 
-                    choice_data['is_correct'], 
-                    i + 1
-                ))
-            
-            # Update local attributes
-            self.unit_text = unit_text
-            self.question = question
-            self.mix_choices = mix_choices
-            self.image = image
-            self.mark = mark
-            self.updated_by = updated_by
+            old_document = self.similarity_document()
+            with db.transaction():
+                result = db.execute_single(query, (unit_text, question, mix_choices, image_value, mark, updated_by, self.id))
+                if not result:
+                    logger.error(f"Question {self.id} not found during update")
+                    raise ValueError(f"Question {self.id} was not found. The question may have been deleted by another user.")
+                
+                self.choices = Choice.apply_diff(self.id, choices)
+                
+                # Cập nhật chỉ mục near-duplicate nếu nội dung thay đổi
+                new_document = question_document(question, [choice.content for choice in self.choices])
+                if new_document != old_document:
+                    similarity_index.index_question(self.id, new_document)
             
-            # Reload choices
-            self.choices = Choice.get_by_question_id(self.id)
+            # Update local attributes từ dòng RETURNING
+            self.unit_text = result['unit_text']
+            self.question = result['question']
+            self.mix_choices = result['mix_choices']
+            self.image = result['image']
+            self.mark = result['mark']
+            self.updated_by = result['updated_by']
+            self.updated_at = result['updated_at']
+            _invalidate_subjects([self.subject_id])
             
             logger.info(f"Question {self.id} updated successfully")
             return True
         except Exception as e:
             logger.error(f"Error updating question {self.id}: {str(e)}")
             # Re-raise the exception with more context
-            if "duplicate key value violates unique constraint" in str(e):
+            if "uq_questions_subject_content_hash" in str(e):
+                raise ValueError("Cannot update question: Another question with the same content already exists in this subject.")
+            elif "duplicate key value violates unique constraint" in str(e):
                 raise ValueError("Cannot update question: Multiple correct answers detected. Please ensure only one choice is marked as correct.")
             elif "foreign key constraint" in str(e):
                 raise ValueError("Cannot update question: Referenced subject or user does not exist.")
@@ -323,43 +785,62 @@ class Question:
                 raise ValueError(f"Failed to update question: {str(e)}")
     
     def delete(self) -> bool:
-        """Xóa question và các choices liên quan"""
+        """Xóa mềm question (đặt deleted_at); dữ liệu thật được dọn bởi purge_deleted()"""
         try:
-            # Tắt trigger tạm thời để tránh lỗi khi xóa choices
-            db.execute_query("ALTER TABLE choices DISABLE TRIGGER ALL")
-            
-            try:
-                # Xóa choices trước (foreign key constraint)
-                db.execute_query("DELETE FROM choices WHERE question_id = %s", (self.id,))
-                
-                # Sau đó xóa question
-                db.execute_query("DELETE FROM questions WHERE id = %s", (self.id,))
-                
-                return True
-            finally:
-                # Bật lại trigger
-                db.execute_query("ALTER TABLE choices ENABLE TRIGGER ALL")
-                
+            deleted_ids = Question.delete_many([self.id])
+            return self.id in deleted_ids
         except Exception as e:
             logger.error(f"Error deleting question {self.id}: {str(e)}")
-            if "foreign key constraint" in str(e):
-                raise ValueError("Cannot delete question: It is being used by an exam. Please remove it from all exams first.")
-            elif "duplicate key value" in str(e):
-                raise ValueError("Cannot delete question: Database constraint violation. Please try again.")
-            else:
-                raise ValueError(f"Failed to delete question: {str(e)}")
+            raise ValueError(f"Failed to delete question: {str(e)}")
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert question thành dict"""
-        # Convert datetime objects to strings
-        created_at = self.created_at
-        if hasattr(created_at, 'isoformat'):
-            created_at = created_at.isoformat()
+    @staticmethod
+    def delete_many(question_ids: List[int]) -> List[int]:
+        """Xóa mềm nhiều question bằng một câu lệnh UPDATE, trả về các id đã xóa.
         
-        updated_at = self.updated_at
-        if updated_at and hasattr(updated_at, 'isoformat'):
-            updated_at = updated_at.isoformat()
+        Chỉ ghi một cột trên từng dòng questions: không khóa bảng, không chặn người đọc.
+        """
+        if not question_ids:
+            return []
+        query = """
+            UPDATE questions SET deleted_at = NOW()
+            WHERE id = ANY(%s) AND deleted_at IS NULL
+            RETURNING id, subject_id
+        """
+        with db.transaction():
+            results = db.execute_query(query, (list(question_ids),))
+        _invalidate_subjects(result['subject_id'] for result in results)
+        deleted_ids = [result['id'] for result in results]
+        logger.info(f"Soft-deleted {len(deleted_ids)} of {len(question_ids)} questions")
+        return deleted_ids
+    
+    @staticmethod
+    def purge_deleted(retention_seconds: float) -> int:
+        """Xóa hẳn các question đã xóa mềm quá retention_seconds và không còn đề nào dùng.
         
+        Một câu lệnh DELETE; choices, signature và bucket similarity bị xóa theo ON DELETE CASCADE.
+        Câu hỏi còn nằm trong exam_version_questions được giữ lại để preview đề cũ.
+        """
+        query = """
+            DELETE FROM questions q
+            WHERE q.deleted_at IS NOT NULL
+            AND q.deleted_at < NOW() - make_interval(secs => %s)
+            AND NOT EXISTS (
+                SELECT 1 FROM exam_version_questions evq WHERE evq.question_id = q.id
+            )
+            RETURNING q.id
+        """
+        with db.transaction():
+            results = db.execute_query(query, (retention_seconds,))
+        if results:
+            logger.info(f"Purged {len(results)} soft-deleted questions")
+        return len(results)
+    
+    def similarity_document(self) -> str:
+        """Văn bản dùng cho chỉ mục near-duplicate (câu hỏi + đáp án)"""
+        return question_document(self.question, [choice.content for choice in self.choices])
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert question thành dict"""
         return {
             'id': self.id,
             'subject_id': self.subject_id,
@@ -369,9 +850,9 @@ class Question:
             'image': self.image,
             'mark': self.mark,
             'created_by': self.created_by,
-            'created_at': created_at,
+            'created_at': self.created_at,
             'updated_by': self.updated_by,
-            'updated_at': updated_at,
+            'updated_at': self.updated_at,
             'choices': [choice.to_dict() for choice in self.choices]
         }
 
@@ -380,14 +861,10 @@ class Question:
 def get_by_question_id(question_id: int) -> List[Choice]:
     """Lấy choices theo question_id"""
     try:
-        query = "SELECT * FROM choices WHERE question_id = %s ORDER BY position"
-        results = db.execute_query(query, (question_id,))
+        results = db.execute_prepared('choices_by_question', (question_id,))
         choices = []
         for result in results:
             try:
-                # Convert datetime to string if needed
-                if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                    result['created_at'] = result['created_at'].isoformat()
                 choices.append(Choice(**result))
             except Exception as e:
                 logger.error(f"Error processing choice {result.get('id', 'unknown')}: {e}")
@@ -400,4 +877,112 @@ def get_by_question_id(question_id: int) -> List[Choice]:
         else:
             raise ValueError(f"Failed to load choices for question {question_id}: {str(e)}")
 
-Choice.get_by_question_id = get_by_question_id 
\ No newline at end of file
+@staticmethod
+def get_by_question_ids(question_ids: List[int]) -> Dict[int, List[Choice]]:
+    """Lấy choices của nhiều question trong một query, gom theo question_id"""
+    choices_by_question = {}
+    if not question_ids:
+        return choices_by_question
+    try:
+        query = f"""
+            SELECT {CHOICE_COLUMNS} FROM choices
+            WHERE question_id = ANY(%s)
+            ORDER BY question_id, position
+        """
+        results = db.execute_query(query, (list(question_ids),))
+        for result in results:
+            choices_by_question.setdefault(result['question_id'], []).append(Choice(**result))
+        return choices_by_question
+    except Exception as e:
+        logger.error(f"Error in get_by_question_ids for {len(question_ids)} questions: {e}")
+        if "connection" in str(e).lower():
+            raise ValueError("Database connection error. Please try again later.")
+        else:
+            raise ValueError(f"Failed to load choices: {str(e)}")
+
+@staticmethod
+def apply_diff(question_id: int, submitted: List[Dict[str, Any]]) -> List[Choice]:
+    """Đồng bộ choices của question với danh sách submitted bằng các lệnh UPDATE/INSERT/DELETE cần thiết.
+    
+    Choice được giữ nguyên id khi khớp (theo `id` nếu client gửi, sau đó theo nội dung,
+    cuối cùng theo thứ tự), nên choice_order_json của các đề đã sinh vẫn trỏ đúng.
+    Thứ tự thực hiện không bao giờ vi phạm uq_one_correct_per_question: xóa trước,
+    rồi các dòng chuyển sang sai, rồi các dòng đúng, cuối cùng mới insert.
+    Phải gọi trong db.transaction(). Trả về choices mới theo position.
+    """
+    existing = db.execute_query(
+        f"SELECT {CHOICE_COLUMNS} FROM choices WHERE question_id = %s ORDER BY position FOR UPDATE",
+        (question_id,)
+    )
+    existing_by_id = {row['id']: row for row in existing}
+    desired = [
+        {
+            'id': choice_data.get('id'),
+            'content': choice_data['content'],
+            'is_correct': bool(choice_data.get('is_correct', False)),
+            'position': i + 1
+        }
+        for i, choice_data in enumerate(submitted)
+    ]
+    
+    # Ghép cặp submitted <-> existing
+    pairs = {}
+    unmatched = []
+    for i, choice in enumerate(desired):
+        if choice['id'] in existing_by_id and choice['id'] not in pairs.values():
+            pairs[i] = choice['id']
+        else:
+            unmatched.append(i)
+    free = [row for row in existing if row['id'] not in pairs.values()]
+    for i in list(unmatched):
+        for row in free:
+            if row['content'] == desired[i]['content']:
+                pairs[i] = row['id']
+                free.remove(row)
+                unmatched.remove(i)
+                break
+    for i, row in zip(list(unmatched), list(free)):
+        pairs[i] = row['id']
+        free.remove(row)
+        unmatched.remove(i)
+    
+    to_delete = [row['id'] for row in free]
+    to_update_false = []
+    to_update_true = []
+    unchanged = []
+    for i, choice_id in pairs.items():
+        row = existing_by_id[choice_id]
+        choice = desired[i]
+        if (row['content'], row['is_correct'], row['position']) == (choice['content'], choice['is_correct'], choice['position']):
+            unchanged.append(row)
+        elif choice['is_correct']:
+            to_update_true.append((choice_id, choice['content'], choice['is_correct'], choice['position']))
+        else:
+            to_update_false.append((choice_id, choice['content'], choice['is_correct'], choice['position']))
+    to_insert = [
+        (question_id, desired[i]['content'], desired[i]['is_correct'], desired[i]['position'])
+        for i in unmatched
+    ]
+    
+    update_query = f"""
+        UPDATE choices AS c
+        SET content = v.content, is_correct = v.is_correct, position = v.position
+        FROM (VALUES %s) AS v(id, content, is_correct, position)
+        WHERE c.id = v.id
+        RETURNING {', '.join(f'c.{column}' for column in CHOICE_COLUMNS.split(', '))}
+    """
+    update_template = "(%s::integer, %s::text, %s::boolean, %s::integer)"
+    rows = list(unchanged)
+    if to_delete:
+        db.execute_query("DELETE FROM choices WHERE id = ANY(%s)", (to_delete,))
+    rows += db.execute_values(update_query, to_update_false, template=update_template, fetch=True)
+    rows += db.execute_values(update_query, to_update_true, template=update_template, fetch=True)
+    rows += db.execute_values(
+        f"INSERT INTO choices (question_id, content, is_correct, position) VALUES %s RETURNING {CHOICE_COLUMNS}",
+        to_insert, fetch=True
+    )
+    return [Choice(**row) for row in sorted(rows, key=lambda row: row['position'])]
+
+Choice.get_by_question_id = get_by_question_id
+Choice.get_by_question_ids = get_by_question_ids
+Choice.apply_diff = apply_diff
\ No newline at end of file
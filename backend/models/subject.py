@@ -1,5 +1,6 @@
 from typing import List, Dict, Any
 from ..database import db
+from .user_subject import UserSubject
 
 class Subject:
     def __init__(self, id: int, name: str, lecturer: str = None, created_at: str = None):
@@ -9,15 +10,17 @@ class Subject:
         self.created_at = created_at
     
     @staticmethod
-    def get_all() -> List['Subject']:
-        """Lấy tất cả subjects"""
-        query = "SELECT * FROM subjects ORDER BY name"
-        results = db.execute_query(query)
+    def get_all(user_id: int = None) -> List['Subject']:
+        """Lấy tất cả subjects; có user_id thì chỉ lấy các môn user xem được (một query)"""
+        if user_id:
+            acl_condition, params = UserSubject.acl_filter(user_id, "id")
+            query = f"SELECT * FROM subjects WHERE {acl_condition} ORDER BY name"
+            results = db.execute_query(query, tuple(params))
+        else:
+            query = "SELECT * FROM subjects ORDER BY name"
+            results = db.execute_query(query)
         subjects = []
         for result in results:
-            # Convert datetime to string if it's a datetime object
-            if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                result['created_at'] = result['created_at'].isoformat()
             subjects.append(Subject(**result))
         return subjects
     
@@ -27,9 +30,6 @@ class Subject:
         query = "SELECT * FROM subjects WHERE id = %s"
         result = db.execute_single(query, (subject_id,))
         if result:
-            # Convert datetime to string if it's a datetime object
-            if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                result['created_at'] = result['created_at'].isoformat()
             return Subject(**result)
         return None
     
@@ -39,9 +39,6 @@ class Subject:
         query = "INSERT INTO subjects (name, lecturer) VALUES (%s, %s) RETURNING *"
         result = db.execute_single(query, (name, lecturer))
         if result:
-            # Convert datetime to string if it's a datetime object
-            if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                result['created_at'] = result['created_at'].isoformat()
             return Subject(**result)
         return None
     
@@ -51,9 +48,6 @@ class Subject:
         query = "SELECT * FROM subjects WHERE name = %s"
         result = db.execute_single(query, (name,))
         if result:
-            # Convert datetime to string if it's a datetime object
-            if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
-                result['created_at'] = result['created_at'].isoformat()
             return Subject(**result)
         return None
     
@@ -68,5 +62,5 @@ class Subject:
             'id': self.id,
             'name': self.name,
             'lecturer': self.lecturer,
-            'created_at': str(self.created_at) if self.created_at else None
+            'created_at': self.created_at
         } 
\ No newline at end of file
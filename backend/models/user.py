@@ -2,6 +2,11 @@ from typing import Optional, Dict, Any
 import bcrypt
 from ..database import db
 
+USER_COLUMNS = "id, username, password, role, created_at"
+
+# Liệt kê cột thay vì SELECT *: plan đã prepare không lỗi khi bảng users có thêm cột
+db.prepare('user_by_username', f"SELECT {USER_COLUMNS} FROM users WHERE username = %s")
+
 class User:
     def __init__(self, id: int, username: str, password: str, role: str, created_at: str):
         self.id = id
@@ -23,8 +28,7 @@ class User:
     @staticmethod
     def authenticate(username: str, password: str) -> Optional['User']:
         """Xác thực user"""
-        query = "SELECT * FROM users WHERE username = %s"
-        result = db.execute_single(query, (username,))
+        result = db.execute_prepared_single('user_by_username', (username,))
         
         if result:
             user = User(**result)
@@ -35,15 +39,14 @@ class User:
     @staticmethod
     def get_by_id(user_id: int) -> Optional['User']:
         """Lấy user theo ID"""
-        query = "SELECT * FROM users WHERE id = %s"
+        query = f"SELECT {USER_COLUMNS} FROM users WHERE id = %s"
         result = db.execute_single(query, (user_id,))
         return User(**result) if result else None
     
     @staticmethod
     def get_by_username(username: str) -> Optional['User']:
         """Lấy user theo username"""
-        query = "SELECT * FROM users WHERE username = %s"
-        result = db.execute_single(query, (username,))
+        result = db.execute_prepared_single('user_by_username', (username,))
         return User(**result) if result else None
     
     def to_dict(self) -> Dict[str, Any]:
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from ..database import db
 
 class UserSubject:
@@ -39,6 +39,29 @@ class UserSubject:
             print(f"Error checking user subject access: {e}")
             return False
     
+    @staticmethod
+    def acl_filter(user_id: int, column: str = "subject_id") -> Tuple[str, list]:
+        """Điều kiện SQL (kèm tham số) giới hạn `column` trong các môn user xem được.
+        
+        User không được phân công môn nào (như importer) xem được tất cả,
+        nên chỉ cần một câu lệnh, không phải lấy danh sách môn trước.
+        """
+        condition = f"""(
+            NOT EXISTS (SELECT 1 FROM user_subjects WHERE user_id = %s)
+            OR {column} IN (SELECT subject_id FROM user_subjects WHERE user_id = %s)
+        )"""
+        return condition, [user_id, user_id]
+    
+    @staticmethod
+    def can_access_subject(user_id: int, subject_id: int) -> bool:
+        """User xem được môn: được phân công môn này, hoặc không được phân công môn nào"""
+        query = """
+            SELECT NOT EXISTS (SELECT 1 FROM user_subjects WHERE user_id = %s)
+                OR EXISTS (SELECT 1 FROM user_subjects WHERE user_id = %s AND subject_id = %s) AS allowed
+        """
+        result = db.execute_single(query, (user_id, user_id, subject_id))
+        return bool(result and result['allowed'])
+    
     @staticmethod
     def get_all_assignments() -> List[Dict[str, Any]]:
         """Lấy tất cả phân công môn học"""
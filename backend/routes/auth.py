@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from typing import Optional
 from ..models.user import User
 from ..models.user_subject import UserSubject
+from ..database import db
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -20,15 +21,15 @@ class LoginResponse(BaseModel):
 async def login(request: LoginRequest):
     """Đăng nhập user"""
     try:
-        user = User.authenticate(request.username, request.password)
+        user = await db.run(User.authenticate, request.username, request.password)
         if user:
             # Lấy môn học được phân công nếu là editor
             assigned_subjects = []
             if user.role == 'editor':
-                subject_ids = UserSubject.get_user_subjects(user.id)
+                subject_ids = await db.run(UserSubject.get_user_subjects, user.id)
                 from ..models.subject import Subject
                 for subject_id in subject_ids:
-                    subject = Subject.get_by_id(subject_id)
+                    subject = await db.run(Subject.get_by_id, subject_id)
                     if subject:
                         assigned_subjects.append(subject.to_dict())
             
@@ -50,7 +51,7 @@ async def login(request: LoginRequest):
 async def get_user(user_id: int):
     """Lấy thông tin user theo ID"""
     try:
-        user = User.get_by_id(user_id)
+        user = await db.run(User.get_by_id, user_id)
         if user:
             return {"success": True, "user": user.to_dict()}
         else:
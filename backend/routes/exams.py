@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
 from pydantic import BaseModel
 from typing import List, Optional
-from ..models.exam import Exam, ExamVersion
+from ..models.exam import Exam, ExamVersion, EXAM_LIST_FIELDS, EXAM_SUMMARY_FIELDS
 from ..models.subject import Subject
 from ..models.question import Question
+from ..database import db
+from ..utils.json_response import fast_json_response
+from ..utils.etag import collection_etag, is_not_modified, not_modified_response
+from ..utils.fields import parse_fields
 from ..utils.subject_code_generator import generate_subject_code, generate_exam_code, get_next_exam_number
 import random
 import json
@@ -37,11 +41,30 @@ class ExamPreviewResponse(BaseModel):
     questions: List[dict]
 
 @router.get("/", response_model=List[ExamResponse])
-async def get_exams():
-    """Lấy tất cả exams"""
+async def get_exams(
+    request: Request,
+    fields: Optional[str] = Query(None, description="Chỉ trả về các field này (phân cách bởi dấu phẩy, luôn có id)"),
+    summary: bool = Query(False, description="Bản rút gọn: " + ", ".join(EXAM_SUMMARY_FIELDS))
+):
+    """Lấy tất cả exams (có ETag, trả 304 khi If-None-Match khớp).
+    
+    `fields` / `summary` chỉ SELECT các cột cần (version_count đếm trong SQL).
+    """
     try:
-        exams = Exam.get_all()
-        return [ExamResponse(**exam.to_dict()) for exam in exams]
+        projection = parse_fields(fields, summary, EXAM_LIST_FIELDS, EXAM_SUMMARY_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        # Danh sách exam kèm tên môn nên phụ thuộc cả exams lẫn subjects
+        etag = await db.run(collection_etag, ('exams', None), ('subjects', None))
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+        if projection:
+            data = await db.run(Exam.get_all_fields, projection)
+            return fast_json_response(data, headers={'ETag': etag})
+        exams = await db.run(Exam.get_all)
+        return fast_json_response([exam.to_dict() for exam in exams], headers={'ETag': etag})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -49,7 +72,7 @@ async def get_exams():
 async def get_exam(exam_id: int):
     """Lấy exam theo ID"""
     try:
-        exam = Exam.get_by_id(exam_id)
+        exam = await db.run(Exam.get_by_id, exam_id)
         if exam:
             return ExamResponse(**exam.to_dict())
         else:
@@ -61,20 +84,20 @@ async def get_exam(exam_id: int):
 async def get_exam_preview(exam_id: int):
     """Lấy preview đề thi với câu hỏi và đáp án đã xáo"""
     try:
-        exam = Exam.get_by_id(exam_id)
+        exam = await db.run(Exam.get_by_id, exam_id)
         if not exam:
             raise HTTPException(status_code=404, detail="Exam not found")
         
         # Lấy version đầu tiên (hoặc tạo mới nếu chưa có)
-        versions = exam.get_versions()
+        versions = await db.run(exam.get_versions)
         if not versions:
             raise HTTPException(status_code=404, detail="No exam version found")
         
         version = versions[0]  # Lấy version đầu tiên
-        questions_data = version.get_questions_with_shuffled_choices()
+        questions_data = await db.run(version.get_questions_with_shuffled_choices)
         
         # Lấy tên môn học
-        subject = Subject.get_by_id(exam.subject_id)
+        subject = await db.run(Subject.get_by_id, exam.subject_id)
         subject_name = subject.name if subject else "Unknown"
         
         return ExamPreviewResponse(
@@ -96,7 +119,7 @@ async def create_exam(request: CreateExamRequest):
         print(f"Creating exam with request: {request}")
         
         # Validate subject exists
-        subject = Subject.get_by_id(request.subject_id)
+        subject = await db.run(Subject.get_by_id, request.subject_id)
         if not subject:
             raise HTTPException(status_code=404, detail="Subject not found")
         
@@ -107,7 +130,7 @@ async def create_exam(request: CreateExamRequest):
         print(f"Generated subject code: {subject_code}")
         
         # Get next exam number
-        exam_number = get_next_exam_number(request.subject_id, subject_code)
+        exam_number = await db.run(get_next_exam_number, request.subject_id, subject_code)
         print(f"Next exam number: {exam_number}")
         
         # Generate exam code
@@ -119,7 +142,7 @@ async def create_exam(request: CreateExamRequest):
         print(f"Generated title: {exam_title}")
         
         # Get random questions from subject
-        questions = Question.get_all(subject_id=request.subject_id)
+        questions = await db.run(Question.get_all, subject_id=request.subject_id)
         print(f"Found {len(questions)} questions for subject")
         
         if len(questions) < request.num_questions:
@@ -134,7 +157,8 @@ async def create_exam(request: CreateExamRequest):
         print(f"Selected question IDs: {question_ids}")
         
         # Create exam
-        exam = Exam.create(
+        exam = await db.run(
+            Exam.create,
             subject_id=request.subject_id,
             code=exam_code,
             title=exam_title,
@@ -165,11 +189,11 @@ async def create_exam(request: CreateExamRequest):
 async def add_exam_version(exam_id: int, question_ids: List[int]):
     """Thêm version mới cho exam"""
     try:
-        exam = Exam.get_by_id(exam_id)
+        exam = await db.run(Exam.get_by_id, exam_id)
         if not exam:
             raise HTTPException(status_code=404, detail="Exam not found")
         
-        version = exam.add_version(question_ids)
+        version = await db.run(exam.add_version, question_ids)
         if version:
             return {"success": True, "version": version.to_dict()}
         else:
@@ -181,7 +205,7 @@ async def add_exam_version(exam_id: int, question_ids: List[int]):
 async def get_exam_version(version_id: int):
     """Lấy exam version theo ID"""
     try:
-        version = ExamVersion.get_by_id(version_id)
+        version = await db.run(ExamVersion.get_by_id, version_id)
         if version:
             return {"success": True, "version": version.to_dict()}
         else:
@@ -7,7 +7,9 @@ import logging
 from ..services.docx_parser import DocxParser
 from ..models.question import Question
 from ..models.subject import Subject
+from ..services.similarity import similarity_index, question_document
 from ..config import settings
+from ..database import db
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +22,7 @@ class ImportResponse(BaseModel):
     imported_questions: int = 0
     skipped_questions: int = 0
     errors: List[str] = []
+    warnings: List[str] = []
     questions: List[Dict[str, Any]] = []
 
 @router.post("/docx", response_model=ImportResponse)
@@ -70,17 +73,17 @@ async def import_docx(
             )
         
         # Tìm subject trong database
-        subject = Subject.get_by_name(subject_name)
+        subject = await db.run(Subject.get_by_name, subject_name)
         if not subject:
             # Tạo subject mới
             lecturer = file_metadata.get('lecturer', '')
-            subject = Subject.create(name=subject_name, lecturer=lecturer)
+            subject = await db.run(Subject.create, name=subject_name, lecturer=lecturer)
             logger.info(f"Created new subject: {subject_name} with lecturer: {lecturer}")
         else:
             # Cập nhật lecturer nếu có
             lecturer = file_metadata.get('lecturer')
             if lecturer and subject.lecturer != lecturer:
-                subject.update_lecturer(lecturer)
+                await db.run(subject.update_lecturer, lecturer)
                 logger.info(f"Updated lecturer for subject {subject_name}: {lecturer}")
         
         subject_id = subject.id
@@ -89,54 +92,57 @@ async def import_docx(
         imported_count = 0
         skipped_count = 0
         errors = []
-        
-        for question_data in questions_data:
-            try:
-                logger.info(f"Importing question {question_data['question_number']}: {question_data['question_text']}")
-                
-                # Convert choices to database format
-                choices = []
-                for choice in question_data['choices']:
-                    choices.append({
-                        'content': choice['content'],
-                        'is_correct': choice['is_correct']
-                    })
-                
-                logger.info(f"Choices: {choices}")
-                
-                # Create question
-                question = Question.create(
-                    subject_id=subject_id,
-                    unit_text=question_data['unit'],
-                    question=question_data['question_text'],
-                    mix_choices=1 if question_data['mix_choices'] else 0,
-                    image=question_data['image'],
-                    mark=question_data['mark'],
-                    created_by=created_by,
-                    choices=choices
+        warnings = []
+        
+        # Cảnh báo câu hỏi gần giống câu đã có trong môn (chỉ mục MinHash/LSH, một lượt query cho cả file).
+        # Signature chỉ tính một lần, dùng lại khi create_many ghi chỉ mục
+        documents = [
+            question_document(question_data['question_text'], [choice['content'] for choice in question_data['choices']])
+            for question_data in questions_data
+        ]
+        signatures = await db.run(similarity_index.signatures, documents)
+        similar_matches = await db.run(
+            similarity_index.find_similar_many, documents, subject_id, signatures=signatures
+        )
+        for question_data, matches in zip(questions_data, similar_matches):
+            if matches:
+                similar_ids = ', '.join(str(question_id) for question_id, _ in matches)
+                warnings.append(
+                    f"Question {question_data['question_number']} is similar to existing question(s) {similar_ids} "
+                    f"({matches[0][1]:.0%} similar)"
                 )
-                
-                if question:
-                    imported_count += 1
-                    logger.info(f"Successfully imported question {question_data['question_number']}")
-                else:
-                    error_msg = f"Failed to import question {question_data['question_number']}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-                    
-            except ValueError as e:
-                # Check if it's a duplicate error
-                if "already exists" in str(e):
-                    skipped_count += 1
-                    logger.info(f"Skipped duplicate question {question_data['question_number']}: {str(e)}")
-                else:
-                    error_msg = f"Error importing question {question_data['question_number']}: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
-            except Exception as e:
-                error_msg = f"Error importing question {question_data['question_number']}: {str(e)}"
+        
+        # Tạo toàn bộ câu hỏi trong một transaction (kiểm tra trùng + multi-row insert)
+        items = [
+            {
+                'subject_id': subject_id,
+                'unit_text': question_data['unit'],
+                'question': question_data['question_text'],
+                'mix_choices': 1 if question_data['mix_choices'] else 0,
+                'image': question_data['image'],
+                'mark': question_data['mark'],
+                'created_by': created_by,
+                'choices': [
+                    {'content': choice['content'], 'is_correct': choice['is_correct']}
+                    for choice in question_data['choices']
+                ],
+                'signature': signature
+            }
+            for question_data, signature in zip(questions_data, signatures)
+        ]
+        results = await db.run(Question.create_many, items)
+        
+        for question_data, result in zip(questions_data, results):
+            if result['success']:
+                imported_count += 1
+            elif result['duplicate']:
+                skipped_count += 1
+                logger.info(f"Skipped duplicate question {question_data['question_number']}")
+            else:
+                error_msg = f"Error importing question {question_data['question_number']}: {result['error']}"
                 logger.error(error_msg)
                 errors.append(error_msg)
+        logger.info(f"Imported {imported_count} questions into subject {subject_id}")
         
         # Clean up uploaded file
         os.remove(file_path)
@@ -148,6 +154,7 @@ async def import_docx(
             imported_questions=imported_count,
             skipped_questions=skipped_count,
             errors=errors,
+            warnings=warnings,
             questions=questions_data
         )
         
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
-from ..models.question import Question, Choice
+import json
+from ..models.question import Question, Choice, QUESTION_LIST_FIELDS, QUESTION_SUMMARY_FIELDS
 from ..models.user_subject import UserSubject
+from ..database import db
+from ..utils.json_response import fast_json_response
+from ..utils.etag import collection_etag, is_not_modified, not_modified_response
+from ..utils.fields import parse_fields
 
 router = APIRouter(prefix="/questions", tags=["Questions"])
 
@@ -28,6 +34,12 @@ class QuestionResponse(BaseModel):
     updated_at: Optional[str] = None
     choices: List[ChoiceResponse]
 
+class QuestionSearchResponse(QuestionResponse):
+    rank: float
+
+class SimilarQuestionResponse(QuestionResponse):
+    similarity: float
+
 class CreateQuestionRequest(BaseModel):
     subject_id: int
     unit_text: Optional[str]
@@ -38,39 +50,81 @@ class CreateQuestionRequest(BaseModel):
     created_by: int
     choices: List[dict]
 
+class BatchCreateRequest(BaseModel):
+    questions: List[CreateQuestionRequest] = Field(..., min_length=1, max_length=1000)
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=10000)
+
+class BatchItemResult(BaseModel):
+    index: int
+    success: bool
+    duplicate: bool = False
+    error: Optional[str] = None
+    question: Optional[QuestionResponse] = None
+
+class BatchCreateResponse(BaseModel):
+    total: int
+    created: int
+    duplicates: int
+    failed: int
+    results: List[BatchItemResult]
+
 @router.get("/", response_model=List[QuestionResponse])
 async def get_questions(
+    request: Request,
     subject_id: Optional[int] = Query(None),
-    user_id: Optional[int] = Query(None)
+    user_id: Optional[int] = Query(None),
+    after_id: Optional[int] = Query(None, description="Id cuối của trang trước (keyset pagination)"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Số câu hỏi tối đa mỗi trang"),
+    unit_text: Optional[str] = Query(None),
+    mark: Optional[float] = Query(None),
+    mix_choices: Optional[int] = Query(None),
+    fields: Optional[str] = Query(None, description="Chỉ trả về các field này (phân cách bởi dấu phẩy, luôn có id)"),
+    summary: bool = Query(False, description="Bản rút gọn: " + ", ".join(QUESTION_SUMMARY_FIELDS))
 ):
-    """Lấy questions theo subject_id và user_id"""
+    """Lấy questions theo subject_id và user_id.
+    
+    Có `limit` thì trả về một trang sắp theo id; trang tiếp theo gọi lại với
+    `after_id` = id cuối cùng của trang hiện tại (hết dữ liệu khi trang có ít hơn `limit` câu).
+    Response có ETag; gửi lại với `If-None-Match` mà dữ liệu không đổi thì nhận 304.
+    `fields` / `summary` chỉ SELECT các cột cần (choice_count, question_snippet tính trong SQL) để giảm payload;
+    summary trả về question_snippet thay cho toàn văn câu hỏi.
+    """
+    try:
+        projection = parse_fields(fields, summary, QUESTION_LIST_FIELDS, QUESTION_SUMMARY_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
+        filters = dict(after_id=after_id, limit=limit, unit_text=unit_text, mark=mark, mix_choices=mix_choices)
+        acl_user_id = None
         if user_id:
-            # Lấy môn học được phân công cho user
-            user_subject_ids = UserSubject.get_user_subjects(user_id)
-            
-            if not user_subject_ids:
-                # User không có môn học được phân công (như importer), trả về tất cả
-                questions = Question.get_all(subject_id)
-                return [QuestionResponse(**question.to_dict()) for question in questions]
-            
             if subject_id:
                 # Kiểm tra user có quyền truy cập môn học này không
-                if subject_id not in user_subject_ids:
+                # (user không được phân công môn nào như importer thì xem được tất cả)
+                if not await db.run(UserSubject.can_access_subject, user_id, subject_id):
                     raise HTTPException(status_code=403, detail="Môn học này không thuộc bạn quản lý")
-                # Lấy câu hỏi của môn học cụ thể
-                questions = Question.get_all(subject_id)
             else:
-                # Lấy câu hỏi của tất cả môn học được phân công
-                questions = []
-                for subj_id in user_subject_ids:
-                    subj_questions = Question.get_all(subj_id)
-                    questions.extend(subj_questions)
-        else:
-            # Không có user_id thì trả về tất cả
-            questions = Question.get_all(subject_id)
+                # Các môn được phân công được lọc ngay trong query lấy câu hỏi
+                acl_user_id = user_id
+        
+        # ETag theo version câu hỏi của môn được lọc (hoặc mọi môn) và phân công môn nếu lọc theo user
+        scopes = [('questions', [subject_id] if subject_id else None)]
+        if user_id:
+            scopes.append(('user_subjects', None))
+        etag = await db.run(collection_etag, *scopes)
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
         
-        return [QuestionResponse(**question.to_dict()) for question in questions]
+        if projection:
+            data = await db.run(Question.get_all_fields, projection, subject_id, user_id=acl_user_id, **filters)
+            return fast_json_response(data, headers={'ETag': etag})
+        
+        questions = await db.run(Question.get_all, subject_id, user_id=acl_user_id, **filters)
+        
+        # to_dict() đã đúng QuestionResponse: trả thẳng, không dựng pydantic model cho từng câu
+        return fast_json_response([question.to_dict() for question in questions], headers={'ETag': etag})
     except HTTPException:
         raise
     except Exception as e:
@@ -83,11 +137,48 @@ async def get_questions(
         else:
             raise HTTPException(status_code=500, detail="An error occurred while loading questions. Please try again.")
 
+@router.get("/search", response_model=List[QuestionSearchResponse])
+async def search_questions(
+    q: str = Query(..., min_length=1, description="Từ khóa tìm trong câu hỏi và đáp án (có dấu hoặc không dấu)"),
+    subject_id: Optional[int] = Query(None),
+    user_id: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=200)
+):
+    """Tìm kiếm full-text câu hỏi, sắp theo độ liên quan, giới hạn trong các môn user được phân công"""
+    try:
+        if user_id and subject_id:
+            if not await db.run(UserSubject.can_access_subject, user_id, subject_id):
+                raise HTTPException(status_code=403, detail="Môn học này không thuộc bạn quản lý")
+        
+        # Phạm vi môn của user (không được phân công môn nào thì tìm trên tất cả) lọc ngay trong query
+        results = await db.run(Question.search, q, subject_id=subject_id, limit=limit, user_id=user_id)
+        return [QuestionSearchResponse(**question.to_dict(), rank=rank) for question, rank in results]
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error searching questions: {e}")
+        if "connection" in str(e).lower() or "database" in str(e).lower():
+            raise HTTPException(status_code=503, detail="Database connection error. Please try again later.")
+        else:
+            raise HTTPException(status_code=500, detail="An error occurred while searching questions. Please try again.")
+
+@router.get("/export")
+async def export_questions(subject_id: Optional[int] = Query(None)):
+    """Export questions (kèm choices) dạng NDJSON, stream từng dòng để bộ nhớ không tăng theo số câu hỏi"""
+    def generate():
+        for question in Question.iter_all(subject_id):
+            yield json.dumps(question.to_dict(), ensure_ascii=False, default=float) + "\n"
+    
+    # StreamingResponse chạy generator đồng bộ trong threadpool, không chặn event loop
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.get("/{question_id}", response_model=QuestionResponse)
 async def get_question(question_id: int):
     """Lấy question theo ID"""
     try:
-        question = Question.get_by_id(question_id)
+        question = await db.run(Question.get_by_id, question_id)
         if question:
             return QuestionResponse(**question.to_dict())
         else:
@@ -101,11 +192,35 @@ async def get_question(question_id: int):
         else:
             raise HTTPException(status_code=500, detail="An error occurred while loading the question. Please try again.")
 
+@router.get("/{question_id}/similar", response_model=List[SimilarQuestionResponse])
+async def get_similar_questions(
+    question_id: int,
+    threshold: float = Query(0.6, ge=0.0, le=1.0, description="Độ giống tối thiểu (Jaccard ước lượng)"),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Tìm các câu hỏi gần giống trong cùng môn (MinHash/LSH)"""
+    try:
+        results = await db.run(Question.find_similar, question_id, threshold=threshold, limit=limit)
+        return [SimilarQuestionResponse(**question.to_dict(), similarity=similarity) for question, similarity in results]
+    except ValueError as e:
+        if "not found" in str(e).lower():
+            raise HTTPException(status_code=404, detail="Question not found")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error finding similar questions for {question_id}: {e}")
+        if "connection" in str(e).lower() or "database" in str(e).lower():
+            raise HTTPException(status_code=503, detail="Database connection error. Please try again later.")
+        else:
+            raise HTTPException(status_code=500, detail="An error occurred while finding similar questions. Please try again.")
+
 @router.post("/", response_model=QuestionResponse)
 async def create_question(request: CreateQuestionRequest):
     """Tạo question mới"""
     try:
-        question = Question.create(
+        question = await db.run(
+            Question.create,
             subject_id=request.subject_id,
             unit_text=request.unit_text,
             question=request.question,
@@ -132,6 +247,38 @@ async def create_question(request: CreateQuestionRequest):
         else:
             raise HTTPException(status_code=500, detail="An error occurred while creating the question. Please try again.")
 
+@router.post("/batch", response_model=BatchCreateResponse)
+async def create_questions_batch(request: BatchCreateRequest):
+    """Tạo nhiều question trong một transaction, trả về kết quả cho từng item"""
+    try:
+        results = await db.run(Question.create_many, [item.model_dump() for item in request.questions])
+        items = [
+            BatchItemResult(
+                index=result['index'],
+                success=result['success'],
+                duplicate=result['duplicate'],
+                error=result['error'],
+                question=QuestionResponse(**result['question'].to_dict()) if result['question'] else None
+            )
+            for result in results
+        ]
+        created = sum(1 for item in items if item.success)
+        return BatchCreateResponse(
+            total=len(items),
+            created=created,
+            duplicates=sum(1 for item in items if item.duplicate),
+            failed=sum(1 for item in items if not item.success and not item.duplicate),
+            results=items
+        )
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error creating questions in batch: {e}")
+        if "connection" in str(e).lower() or "database" in str(e).lower():
+            raise HTTPException(status_code=503, detail="Database connection error. Please try again later.")
+        else:
+            raise HTTPException(status_code=500, detail="An error occurred while creating the questions. Please try again.")
+
 @router.put("/{question_id}")
 async def update_question(question_id: int, request: CreateQuestionRequest):
     """Cập nhật question"""
@@ -140,13 +287,14 @@ async def update_question(question_id: int, request: CreateQuestionRequest):
         logger = logging.getLogger(__name__)
         logger.info(f"Updating question {question_id}")
         
-        question = Question.get_by_id(question_id)
+        question = await db.run(Question.get_by_id, question_id)
         if not question:
             logger.error(f"Question {question_id} not found")
             raise HTTPException(status_code=404, detail="Question not found")
         
         logger.info(f"Found question {question_id}, updating...")
-        success = question.update(
+        success = await db.run(
+            question.update,
             unit_text=request.unit_text,
             question=request.question,
             mix_choices=request.mix_choices,
@@ -175,19 +323,36 @@ async def update_question(question_id: int, request: CreateQuestionRequest):
         else:
             raise HTTPException(status_code=500, detail="An error occurred while updating the question. Please try again.")
 
+@router.delete("/")
+async def delete_questions(request: BulkDeleteRequest):
+    """Xóa (mềm) nhiều question bằng một câu lệnh"""
+    try:
+        deleted_ids = await db.run(Question.delete_many, request.ids)
+        return {
+            "success": True,
+            "deleted": len(deleted_ids),
+            "deleted_ids": deleted_ids,
+            "not_found_ids": sorted(set(request.ids) - set(deleted_ids))
+        }
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error deleting questions: {e}")
+        if "connection" in str(e).lower() or "database" in str(e).lower():
+            raise HTTPException(status_code=503, detail="Database connection error. Please try again later.")
+        else:
+            raise HTTPException(status_code=500, detail="An error occurred while deleting the questions. Please try again.")
+
 @router.delete("/{question_id}")
 async def delete_question(question_id: int):
-    """Xóa question"""
+    """Xóa (mềm) question; câu hỏi biến mất khỏi mọi danh sách, đề đã sinh vẫn xem được"""
     try:
-        question = Question.get_by_id(question_id)
-        if not question:
+        deleted_ids = await db.run(Question.delete_many, [question_id])
+        if not deleted_ids:
             raise HTTPException(status_code=404, detail="Question not found")
-        
-        success = question.delete()
-        if success:
-            return {"success": True, "message": "Question deleted successfully"}
-        else:
-            raise HTTPException(status_code=400, detail="Failed to delete question. The question may be in use by an exam.")
+        return {"success": True, "message": "Question deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
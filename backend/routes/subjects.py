@@ -1,8 +1,11 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from pydantic import BaseModel
 from typing import List, Optional
 from ..models.subject import Subject
-from ..models.user_subject import UserSubject
+from ..models.question import Question
+from ..database import db
+from ..utils.json_response import fast_json_response
+from ..utils.etag import collection_etag, is_not_modified, not_modified_response
 
 router = APIRouter(prefix="/subjects", tags=["Subjects"])
 
@@ -11,30 +14,48 @@ class SubjectResponse(BaseModel):
     name: str
     created_at: str
 
+class UnitStats(BaseModel):
+    unit_text: Optional[str]
+    count: int
+    total_mark: float
+
+class MarkStats(BaseModel):
+    mark: Optional[float]
+    count: int
+
+class MixChoicesStats(BaseModel):
+    mix_choices: int
+    count: int
+
+class SubjectStatsResponse(BaseModel):
+    subject_id: int
+    total_questions: int
+    total_mark: float
+    by_unit: List[UnitStats]
+    by_mark: List[MarkStats]
+    by_mix_choices: List[MixChoicesStats]
+
+def _subject_list_response(subjects, etag: str):
+    # Chỉ giữ các field của SubjectResponse, trả thẳng không qua pydantic
+    return fast_json_response([
+        {'id': subject.id, 'name': subject.name, 'created_at': subject.created_at} for subject in subjects
+    ], headers={'ETag': etag})
+
 @router.get("/", response_model=List[SubjectResponse])
-async def get_subjects(user_id: Optional[int] = Query(None)):
-    """Lấy subjects theo user_id"""
+async def get_subjects(request: Request, user_id: Optional[int] = Query(None)):
+    """Lấy subjects theo user_id (có ETag, trả 304 khi If-None-Match khớp)"""
     try:
+        scopes = [('subjects', None)]
         if user_id:
-            # Lấy môn học được phân công cho user
-            subject_ids = UserSubject.get_user_subjects(user_id)
-            
-            # Nếu user không có môn học được phân công (như importer), trả về tất cả
-            if not subject_ids:
-                subjects = Subject.get_all()
-                return [SubjectResponse(**subject.to_dict()) for subject in subjects]
-            
-            # Nếu có môn học được phân công, trả về các môn đó
-            subjects = []
-            for subject_id in subject_ids:
-                subject = Subject.get_by_id(subject_id)
-                if subject:
-                    subjects.append(subject)
-            return [SubjectResponse(**subject.to_dict()) for subject in subjects]
-        else:
-            # Không có user_id thì trả về tất cả
-            subjects = Subject.get_all()
-            return [SubjectResponse(**subject.to_dict()) for subject in subjects]
+            scopes.append(('user_subjects', None))
+        etag = await db.run(collection_etag, *scopes)
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+        
+        # Môn được phân công cho user (không được phân công môn nào như importer thì tất cả),
+        # lọc ngay trong một query
+        subjects = await db.run(Subject.get_all, user_id)
+        return _subject_list_response(subjects, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -42,7 +63,7 @@ async def get_subjects(user_id: Optional[int] = Query(None)):
 async def get_subject(subject_id: int):
     """Lấy subject theo ID"""
     try:
-        subject = Subject.get_by_id(subject_id)
+        subject = await db.run(Subject.get_by_id, subject_id)
         if subject:
             return SubjectResponse(**subject.to_dict())
         else:
@@ -50,11 +71,30 @@ async def get_subject(subject_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{subject_id}/stats", response_model=SubjectStatsResponse)
+async def get_subject_stats(subject_id: int):
+    """Thống kê ngân hàng câu hỏi của môn (số câu theo unit, mark, mix_choices và tổng điểm)"""
+    try:
+        stats = await db.run(Question.get_subject_stats, subject_id)
+        if stats is None:
+            raise HTTPException(status_code=404, detail="Subject not found")
+        return stats
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error getting stats for subject {subject_id}: {e}")
+        if "connection" in str(e).lower() or "database" in str(e).lower():
+            raise HTTPException(status_code=503, detail="Database connection error. Please try again later.")
+        else:
+            raise HTTPException(status_code=500, detail="An error occurred while loading subject statistics. Please try again.")
+
 @router.post("/", response_model=SubjectResponse)
 async def create_subject(name: str):
     """Tạo subject mới"""
     try:
-        subject = Subject.create(name)
+        subject = await db.run(Subject.create, name)
         if subject:
             return SubjectResponse(**subject.to_dict())
         else:
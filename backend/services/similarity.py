@@ -0,0 +1,235 @@
+import hashlib
+import random
+import re
+import unicodedata
+import zlib
+from typing import List, Dict, Tuple, Optional, Iterable
+import logging
+from ..database import db
+
+logger = logging.getLogger(__name__)
+
+# Số nguyên tố Mersenne 2^31 - 1: giá trị signature luôn vừa kiểu INTEGER của Postgres
+_PRIME = (1 << 31) - 1
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa để so sánh: bỏ dấu tiếng Việt, chữ thường, bỏ dấu câu, gộp khoảng trắng"""
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD_RE.sub(' ', text.lower()).strip()
+
+def question_document(question_text: str, choice_contents: Iterable[str] = ()) -> str:
+    """Văn bản đại diện một câu hỏi: nội dung câu hỏi + nội dung các đáp án"""
+    return ' '.join([question_text or '', *[content or '' for content in choice_contents]])
+
+class SimilarityIndex:
+    """Chỉ mục near-duplicate bằng MinHash + LSH.
+    
+    Mỗi câu hỏi có một MinHash signature (NUM_PERM giá trị) trên tập shingle ký tự
+    của văn bản đã chuẩn hóa; signature được chia thành BANDS band, mỗi band băm
+    thành một bucket. Hai câu hỏi là ứng viên khi trùng ít nhất một bucket, sau đó
+    mới ước lượng Jaccard từ signature - không bao giờ so sánh từng cặp trên cả ngân hàng.
+    
+    Với 16 band x 4 dòng, cặp có Jaccard ~0.5 có khoảng 50% khả năng thành ứng viên,
+    cặp >= 0.7 gần như chắc chắn.
+    """
+    
+    NUM_PERM = 64
+    BANDS = 16
+    SHINGLE_SIZE = 5
+    MAX_CANDIDATES = 200
+    
+    def __init__(self, seed: int = 1):
+        # Hệ số hoán vị cố định: signature đã lưu phải so được với signature tính sau này
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(self.NUM_PERM)
+        ]
+        self.rows_per_band = self.NUM_PERM // self.BANDS
+    
+    def shingles(self, document: str) -> set:
+        text = normalize_text(document)
+        return {text[i:i + self.SHINGLE_SIZE] for i in range(len(text) - self.SHINGLE_SIZE + 1)}
+    
+    def signature(self, document: str) -> Optional[List[int]]:
+        """MinHash signature của văn bản.
+        
+        None khi văn bản rỗng hoặc ngắn hơn một shingle: các văn bản như vậy sẽ có
+        cùng một signature và bị coi là giống hệt nhau, nên không đưa vào chỉ mục.
+        """
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in self.shingles(document)]
+        if not hashes:
+            return None
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self.permutations]
+    
+    def signatures(self, documents: List[str]) -> List[Optional[List[int]]]:
+        """Signature của nhiều văn bản: tính một lần rồi truyền cho find_similar_many và index_questions"""
+        return [self.signature(document) for document in documents]
+    
+    def band_hashes(self, signature: List[int]) -> List[int]:
+        """Bucket (BIGINT có dấu) của từng band"""
+        buckets = []
+        for band in range(self.BANDS):
+            rows = signature[band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            digest = hashlib.blake2b(','.join(map(str, rows)).encode('ascii'), digest_size=8).digest()
+            buckets.append(int.from_bytes(digest, 'big', signed=True))
+        return buckets
+    
+    @staticmethod
+    def estimate_similarity(signature_a: List[int], signature_b: List[int]) -> float:
+        """Ước lượng Jaccard = tỷ lệ vị trí trùng nhau của hai signature"""
+        matches = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+        return matches / len(signature_a)
+    
+    def index_questions(self, documents: List[Tuple[int, str]],
+                        signatures: Optional[List[Optional[List[int]]]] = None):
+        """Ghi (hoặc ghi đè) signature + bucket cho các câu hỏi [(question_id, document)].
+        
+        `signatures` (cùng thứ tự documents) là kết quả signature() đã tính sẵn.
+        Câu hỏi không có signature (văn bản quá ngắn) bị bỏ khỏi chỉ mục.
+        Gọi bên trong transaction tạo/cập nhật câu hỏi để chỉ mục luôn khớp dữ liệu.
+        """
+        if not documents:
+            return
+        if signatures is None:
+            signatures = self.signatures([document for _, document in documents])
+        signature_rows = []
+        bucket_rows = []
+        unindexed_ids = []
+        for (question_id, _), signature in zip(documents, signatures):
+            if signature is None:
+                unindexed_ids.append(question_id)
+                continue
+            signature_rows.append((question_id, signature))
+            bucket_rows.extend(
+                (band, bucket_hash, question_id) for band, bucket_hash in enumerate(self.band_hashes(signature))
+            )
+        
+        question_ids = [question_id for question_id, _ in documents]
+        with db.transaction():
+            db.execute_query("DELETE FROM question_lsh_buckets WHERE question_id = ANY(%s)", (question_ids,))
+            if unindexed_ids:
+                db.execute_query("DELETE FROM question_minhash WHERE question_id = ANY(%s)", (unindexed_ids,))
+            if signature_rows:
+                db.execute_values("""
+                    INSERT INTO question_minhash (question_id, signature) VALUES %s
+                    ON CONFLICT (question_id) DO UPDATE SET signature = EXCLUDED.signature
+                """, signature_rows)
+                db.execute_values(
+                    "INSERT INTO question_lsh_buckets (band, bucket_hash, question_id) VALUES %s",
+                    bucket_rows
+                )
+    
+    def index_question(self, question_id: int, document: str):
+        self.index_questions([(question_id, document)])
+    
+    def find_similar_many(self, documents: List[str], subject_id: Optional[int] = None,
+                          threshold: float = 0.6, limit: int = 10,
+                          exclude_ids: Optional[List[Optional[int]]] = None,
+                          signatures: Optional[List[Optional[List[int]]]] = None) -> List[List[Tuple[int, float]]]:
+        """Tìm câu hỏi gần giống cho nhiều văn bản bằng một lượt query.
+        
+        `signatures` là signature đã tính sẵn của documents (xem signatures()).
+        Văn bản không có signature (quá ngắn) không có kết quả.
+        Trả về, theo thứ tự documents, danh sách (question_id, độ giống) đã sắp giảm dần.
+        """
+        if not documents:
+            return []
+        if signatures is None:
+            signatures = self.signatures(documents)
+        ords, bands, buckets = [], [], []
+        for i, signature in enumerate(signatures):
+            if signature is None:
+                continue
+            for band, bucket_hash in enumerate(self.band_hashes(signature)):
+                ords.append(i)
+                bands.append(band)
+                buckets.append(bucket_hash)
+        if not ords:
+            return [[] for _ in documents]
+        
+        subject_filter = ""
+        params = [ords, bands, buckets]
+        if subject_id:
+            subject_filter = "AND q.subject_id = %s"
+            params.append(subject_id)
+        params.append(self.MAX_CANDIDATES)
+        # Chỉ giữ MAX_CANDIDATES ứng viên trùng nhiều band nhất cho mỗi văn bản ngay trong
+        # query, để bucket quá phổ biến không kéo cả môn về
+        query = f"""
+            SELECT ord, question_id, matched_bands
+            FROM (
+                SELECT t.ord, b.question_id, COUNT(*) AS matched_bands,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY t.ord ORDER BY COUNT(*) DESC, b.question_id DESC
+                       ) AS candidate_rank
+                FROM unnest(%s::int[], %s::smallint[], %s::bigint[]) AS t(ord, band, bucket_hash)
+                JOIN question_lsh_buckets b ON b.band = t.band AND b.bucket_hash = t.bucket_hash
+                JOIN questions q ON q.id = b.question_id AND q.deleted_at IS NULL {subject_filter}
+                GROUP BY t.ord, b.question_id
+            ) ranked
+            WHERE candidate_rank <= %s
+        """
+        candidate_rows = db.execute_query(query, tuple(params))
+        
+        candidates: Dict[int, List[int]] = {}
+        for row in candidate_rows:
+            candidates.setdefault(row['ord'], []).append(row['question_id'])
+        
+        candidate_ids = list({question_id for question_ids in candidates.values() for question_id in question_ids})
+        stored = {}
+        if candidate_ids:
+            signature_rows = db.execute_query(
+                "SELECT question_id, signature FROM question_minhash WHERE question_id = ANY(%s)",
+                (candidate_ids,)
+            )
+            stored = {row['question_id']: row['signature'] for row in signature_rows}
+        
+        results = []
+        for i, signature in enumerate(signatures):
+            exclude_id = exclude_ids[i] if exclude_ids else None
+            matches = []
+            for question_id in candidates.get(i, []):
+                if question_id == exclude_id or question_id not in stored:
+                    continue
+                similarity = self.estimate_similarity(signature, stored[question_id])
+                if similarity >= threshold:
+                    matches.append((question_id, similarity))
+            matches.sort(key=lambda match: (-match[1], match[0]))
+            results.append(matches[:limit])
+        return results
+    
+    def find_similar(self, document: str, subject_id: Optional[int] = None, threshold: float = 0.6,
+                     limit: int = 10, exclude_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Tìm câu hỏi gần giống một văn bản: [(question_id, độ giống)]"""
+        return self.find_similar_many([document], subject_id, threshold, limit, [exclude_id])[0]
+    
+    def rebuild(self, batch_size: int = 1000) -> int:
+        """Tính lại chỉ mục cho toàn bộ câu hỏi (dùng cho dữ liệu có sẵn trước khi có chỉ mục)"""
+        from ..models.question import Question
+        
+        indexed = 0
+        batch = []
+        for question in Question.iter_all():
+            batch.append((question.id, question_document(question.question, [c.content for c in question.choices])))
+            if len(batch) >= batch_size:
+                self.index_questions(batch)
+                indexed += len(batch)
+                batch = []
+        self.index_questions(batch)
+        indexed += len(batch)
+        logger.info(f"Rebuilt similarity index for {indexed} questions")
+        return indexed
+
+similarity_index = SimilarityIndex()
+
+if __name__ == '__main__':
+    # python -m backend.services.similarity: dựng chỉ mục cho dữ liệu có sẵn
+    logging.basicConfig(level=logging.INFO)
+    db.connect()
+    try:
+        similarity_index.rebuild()
+    finally:
+        db.close()
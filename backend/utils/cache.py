@@ -0,0 +1,146 @@
+"""
+Cache trong bộ nhớ process cho các kết quả đọc nhiều, ghi ít
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+class TTLCache:
+    """
+    Cache key -> value, mỗi mục hết hạn sau ttl_seconds.
+
+    An toàn khi gọi từ nhiều thread (executor của db.run). Người ghi dữ liệu
+    gọi invalidate() sau khi ghi; TTL chặn dữ liệu cũ khi chạy nhiều process.
+    ttl_seconds <= 0 thì tắt cache.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Hashable, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def invalidate(self, keys: Iterable[Hashable]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+class LRUCache:
+    """
+    Cache key -> value giới hạn theo tổng "kích thước" (size_of(value)), bỏ mục ít dùng nhất khi đầy.
+
+    get_or_load() gọi loader khi miss; nếu trong lúc load có invalidate() cùng key
+    thì kết quả không được lưu, tránh đưa lại dữ liệu cũ vào cache.
+    max_size <= 0 thì tắt cache.
+    """
+
+    def __init__(self, max_size: int, size_of: Callable[[Any], int] = lambda value: 1):
+        self.max_size = max_size
+        self.size_of = size_of
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._epoch = 0  # tăng khi clear(), vô hiệu mọi lần load đang chạy
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        # Không tính hit/miss, không đổi thứ tự LRU
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(key, 0))
+
+        value = loader()
+
+        with self._lock:
+            if (self._epoch, self._generations.get(key, 0)) == generation:
+                self._store(key, value)
+        return value
+
+    def _store(self, key: Hashable, value: Any):
+        size = self.size_of(value)
+        if self.max_size <= 0 or size > self.max_size:
+            return
+        self._remove(key)
+        while self._entries and self._size + size > self.max_size:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+        self._entries[key] = (value, size)
+        self._size += size
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def invalidate(self, keys: Iterable[Hashable]):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self._size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
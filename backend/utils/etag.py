@@ -0,0 +1,54 @@
+"""
+ETag / conditional GET cho các endpoint danh sách
+"""
+import hashlib
+from typing import List, Optional, Tuple
+from fastapi import Request, Response
+from ..config import settings
+from ..database import db
+
+def collection_etag(*scopes: Tuple[str, Optional[List[int]]]) -> str:
+    """
+    Weak ETag từ version (bảng collection_versions, do trigger tăng) của các collection.
+
+    Mỗi scope là (collection, scope_ids): scope_ids=None lấy cả collection,
+    ngược lại chỉ cộng version của các scope_id đó (ví dụ các subject_id).
+    Chỉ một query nhỏ trên bảng version, không đụng tới dữ liệu.
+    Gọi trước khi load dữ liệu: có ghi xen giữa thì ETag cũ hơn dữ liệu, lần sau sẽ tải lại.
+    """
+    columns, params = [], []
+    for i, (collection, scope_ids) in enumerate(scopes):
+        if scope_ids is None:
+            columns.append(f"COALESCE(SUM(version) FILTER (WHERE collection = %s), 0) AS v{i}")
+            params.append(collection)
+        else:
+            columns.append(f"COALESCE(SUM(version) FILTER (WHERE collection = %s AND scope_id = ANY(%s)), 0) AS v{i}")
+            params.extend([collection, list(scope_ids)])
+    params.append([collection for collection, _ in scopes])
+    query = f"SELECT {', '.join(columns)} FROM collection_versions WHERE collection = ANY(%s)"
+    result = db.execute_single(query, tuple(params))
+
+    # Kèm version app: đổi format response sau khi deploy thì ETag cũ không còn khớp
+    versions = [settings.APP_VERSION] + [str(result[f"v{i}"]) for i in range(len(scopes))]
+    for collection, scope_ids in scopes:
+        versions.append(f"{collection}:{sorted(scope_ids) if scope_ids is not None else '*'}")
+    digest = hashlib.blake2b('|'.join(versions).encode('utf-8'), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def _opaque_tag(tag: str) -> str:
+    # So sánh weak: bỏ tiền tố W/
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Client đã có bản ứng với etag (header If-None-Match)"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return _opaque_tag(etag) in {_opaque_tag(tag) for tag in header.split(',')}
+
+def not_modified_response(etag: str) -> Response:
+    """304 không có body"""
+    return Response(status_code=304, headers={'ETag': etag})
@@ -0,0 +1,22 @@
+"""
+Chọn field cho các endpoint danh sách (?fields=...&summary=true)
+"""
+from typing import List, Optional
+
+def parse_fields(fields: Optional[str], summary: bool, allowed: List[str],
+                 summary_fields: List[str]) -> Optional[List[str]]:
+    """
+    Danh sách field cần trả về, theo thứ tự của `allowed`.
+
+    None nghĩa là trả về đầy đủ như trước. `summary` lấy bộ summary_fields,
+    `fields` (phân cách bởi dấu phẩy) thêm field tùy chọn; field lạ thì ValueError.
+    """
+    if not fields and not summary:
+        return None
+    requested = set(summary_fields) if summary else set()
+    if fields:
+        requested.update(field.strip() for field in fields.split(",") if field.strip())
+    unknown = sorted(requested - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return [field for field in allowed if field in requested]
@@ -0,0 +1,25 @@
+"""
+Response JSON nhanh cho các endpoint trả về danh sách lớn
+"""
+from typing import Any, Dict, Optional
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+except ImportError:
+    orjson = None
+    ORJSONResponse = None
+
+def fast_json_response(content: Any, status_code: int = 200,
+                       headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    """
+    Trả thẳng dữ liệu đã đúng schema (list dict từ to_dict()) thành Response.
+
+    FastAPI bỏ qua bước validate response_model khi route trả về Response,
+    nên không dựng pydantic model cho từng phần tử. Dùng orjson nếu có cài,
+    nếu không thì quay về json chuẩn.
+    """
+    if ORJSONResponse is not None:
+        return ORJSONResponse(content, status_code=status_code, headers=headers)
+    return JSONResponse(content, status_code=status_code, headers=headers)
@@ -0,0 +1,98 @@
+"""Benchmark throughput (request/s) của endpoint danh sách câu hỏi theo số câu mỗi
+response: QuestionResponse(**to_dict()) + validate response_model + json chuẩn (cũ)
+so với trả thẳng to_dict() qua fast_json_response/orjson (mới).
+
+Không cần database: dữ liệu giả lập, request gửi thẳng vào ứng dụng ASGI trong process:
+
+    python -m benchmarks.bench_list_serialization --sizes 10,100,1000,5000 --seconds 2
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from fastapi import FastAPI
+
+from backend.models.question import Question, Choice
+from backend.routes.questions import QuestionResponse
+from backend.utils.json_response import fast_json_response, orjson
+
+def make_questions(num_questions: int) -> List[Question]:
+    created_at = '2024-01-01T00:00:00'
+    questions = []
+    for i in range(1, num_questions + 1):
+        question = Question(
+            id=i, subject_id=1, unit_text=f"Unit {i % 10}", question=f"Câu hỏi benchmark số {i}",
+            mix_choices=1, image=None, mark=1.0, created_by=1, created_at=created_at,
+            updated_by=None, updated_at=created_at
+        )
+        question.choices = [
+            Choice(id=i * 4 + p, question_id=i, content=f"Phương án {p}", is_correct=p == 1,
+                   position=p, created_at=created_at)
+            for p in range(1, 5)
+        ]
+        questions.append(question)
+    return questions
+
+def build_app(questions: List[Question]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/before", response_model=List[QuestionResponse])
+    async def before():
+        return [QuestionResponse(**question.to_dict()) for question in questions]
+
+    @app.get("/after", response_model=List[QuestionResponse])
+    async def after():
+        return fast_json_response([question.to_dict() for question in questions])
+
+    return app
+
+async def call(app: FastAPI, path: str) -> int:
+    """Gửi một GET vào ứng dụng ASGI, trả về số byte của body"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+        'query_string': b'', 'headers': [], 'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+    }
+    body_size = 0
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal body_size
+        if message['type'] == 'http.response.body':
+            body_size += len(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return body_size
+
+async def throughput(app: FastAPI, path: str, seconds: float):
+    """Gọi liên tục trong `seconds` giây: (request/s, kích thước payload)"""
+    body_size = await call(app, path)
+    requests = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        await call(app, path)
+        requests += 1
+    return requests / (time.perf_counter() - start), body_size
+
+async def run(sizes: List[int], seconds: float):
+    print(f"orjson: {'có' if orjson else 'không'}")
+    print(f"{'questions':>10} {'payload KB':>11} {'before req/s':>13} {'after req/s':>12} {'speedup':>8}")
+    for size in sizes:
+        app = build_app(make_questions(size))
+        before_rps, body_size = await throughput(app, '/before', seconds)
+        after_rps, _ = await throughput(app, '/after', seconds)
+        print(f"{size:>10} {body_size / 1024:>11.1f} {before_rps:>13.1f} {after_rps:>12.1f}"
+              f" {after_rps / before_rps:>7.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,5000')
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(run([int(size) for size in args.sizes.split(',')], args.seconds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark bộ nhớ khi giữ N câu hỏi (mỗi câu 4 phương án) trong RAM: model có
+__dict__ từng instance (cũ) so với model dùng __slots__ (mới).
+
+Không cần database: dòng được sinh giả lập với cùng cột như bảng questions/choices.
+Mỗi chế độ chạy trong một process riêng để peak RSS không lẫn vào nhau:
+
+    python -m benchmarks.bench_model_memory --questions 100000
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+from backend.models.question import Question, Choice
+
+# Bản sao không có __slots__ của hai model, dùng lại đúng __init__ để so sánh công bằng
+DictQuestion = type('DictQuestion', (), {'__init__': Question.__init__})
+DictChoice = type('DictChoice', (), {'__init__': Choice.__init__})
+
+MODELS = {
+    'dict': (DictQuestion, DictChoice),
+    'slots': (Question, Choice),
+}
+
+def build(num_questions: int, question_cls, choice_cls) -> list:
+    """Dựng num_questions câu hỏi như Question.get_all trả về"""
+    created_at = '2024-01-01T00:00:00'
+    questions = []
+    for i in range(1, num_questions + 1):
+        question = question_cls(
+            id=i, subject_id=1, unit_text=f"Unit {i % 10}", question=f"Bench question {i}",
+            mix_choices=1, image=None, mark=1.0, created_by=1, created_at=created_at,
+            updated_by=None, updated_at=created_at
+        )
+        question.choices = [
+            choice_cls(id=i * 4 + p, question_id=i, content=f"Choice {p}", is_correct=p == 1,
+                       position=p, created_at=created_at)
+            for p in range(1, 5)
+        ]
+        questions.append(question)
+    return questions
+
+def run_mode(mode: str, num_questions: int):
+    """Đo trong process hiện tại và in một dòng kết quả"""
+    question_cls, choice_cls = MODELS[mode]
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    questions = build(num_questions, question_cls, choice_cls)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss trên Linux tính bằng KB; có cả phần tracemalloc dùng, chỉ nên so sánh tương đối
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss
+    per_100k = 100000 / num_questions
+    print(f"{mode:>6} {peak / 1024 / 1024 * per_100k:>14.1f} {peak_rss / 1024 * per_100k:>14.1f}"
+          f" {peak / len(questions):>12.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--mode', choices=sorted(MODELS))
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.questions)
+        return
+
+    print(f"questions={args.questions}")
+    print(f"{'mode':>6} {'alloc MB/100k':>14} {'RSS MB/100k':>14} {'B/question':>12}")
+    for mode in ('dict', 'slots'):
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_model_memory',
+             '--questions', str(args.questions), '--mode', mode],
+            check=True
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark đọc danh sách câu hỏi (Question._query_all) theo số câu hỏi của môn: số query và độ trễ
+của cách cũ (một query choices cho mỗi question) so với cách mới (bulk ANY(%s)).
+
+Dữ liệu được seed trong một transaction và rollback khi xong, cần DATABASE_URL:
+
+    python -m benchmarks.bench_question_listing --sizes 100,1000,3000 --repeat 3
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from backend.database import db
+from backend.models.question import Question, Choice, QUESTION_COLUMNS
+
+class _Rollback(Exception):
+    pass
+
+def seed_subject(num_questions: int) -> int:
+    """Tạo user + subject + num_questions câu hỏi (4 phương án/câu), trả về subject_id"""
+    suffix = uuid.uuid4().hex[:8]
+    user = db.execute_single(
+        "INSERT INTO users (username, password, role) VALUES (%s, %s, 'importer') RETURNING id",
+        (f"bench_{suffix}", 'bench')
+    )
+    subject = db.execute_single(
+        "INSERT INTO subjects (name) VALUES (%s) RETURNING id",
+        (f"Bench subject {suffix}",)
+    )
+    db.execute_query("""
+        INSERT INTO questions (subject_id, unit_text, question, created_by)
+        SELECT %s, 'Unit ' || (g % 10), 'Bench question ' || g, %s
+        FROM generate_series(1, %s) AS g
+    """, (subject['id'], user['id'], num_questions))
+    db.execute_query("""
+        INSERT INTO choices (question_id, content, is_correct, position)
+        SELECT q.id, 'Choice ' || p, p = 1, p
+        FROM questions q CROSS JOIN generate_series(1, 4) AS p
+        WHERE q.subject_id = %s
+    """, (subject['id'],))
+    return subject['id']
+
+def get_all_n_plus_one(subject_id: int):
+    """Cách cũ: mỗi question một lần gọi Choice.get_by_question_id"""
+    # Chọn đúng các cột của model: bảng có thêm cột nội bộ (search_vector, content_hash, deleted_at)
+    results = db.execute_query(
+        f"SELECT {QUESTION_COLUMNS} FROM questions WHERE subject_id = %s AND deleted_at IS NULL ORDER BY id",
+        (subject_id,)
+    )
+    questions = []
+    for result in results:
+        question = Question(**result)
+        question.choices = Choice.get_by_question_id(question.id)
+        questions.append(question)
+    return questions
+
+def measure(func, subject_id: int, repeat: int):
+    timings = []
+    query_count = 0
+    for _ in range(repeat):
+        db.queries.reset()
+        start = time.perf_counter()
+        func(subject_id)
+        timings.append(time.perf_counter() - start)
+        query_count = sum(entry['count'] for entry in db.queries.stats()['queries'])
+    return query_count, statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,3000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    db.connect()
+    try:
+        print(f"{'questions':>10} {'old queries':>12} {'old ms':>10} {'new queries':>12} {'new ms':>10}")
+        for size in sizes:
+            try:
+                # Seed + đo trên cùng một connection, rollback để không để lại dữ liệu
+                with db.transaction():
+                    subject_id = seed_subject(size)
+                    old_queries, old_ms = measure(get_all_n_plus_one, subject_id, args.repeat)
+                    # _query_all thay vì get_all: get_all đọc qua question_cache, các lần lặp sau chỉ đo cache hit
+                    new_queries, new_ms = measure(Question._query_all, subject_id, args.repeat)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+            print(f"{size:>10} {old_queries:>12} {old_ms:>10.1f} {new_queries:>12} {new_ms:>10.1f}")
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark chi phí liệt kê 10k dòng: RealDictCursor + isoformat từng dòng (cũ)
+so với tuple cursor + decoder theo kiểu cột của backend.database (mới).
+
+Chạy từ thư mục gốc của repo, cần DATABASE_URL trỏ tới Postgres:
+
+    python -m benchmarks.bench_row_decoding --rows 10000 --repeat 5
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+import psycopg2.extras
+
+from backend.database import db
+from backend.models.question import Question
+
+# Dòng giả lập có cùng cột với bảng questions, không cần dữ liệu thật
+QUERY = """
+    SELECT g AS id, 1 AS subject_id, 'Unit ' || (g % 10) AS unit_text,
+           'Question text number ' || g AS question, 1 AS mix_choices,
+           NULL::text AS image, (g % 4 + 0.5)::numeric(5,2) AS mark,
+           1 AS created_by, NOW()::timestamp AS created_at,
+           NULL::integer AS updated_by, NOW()::timestamp AS updated_at
+    FROM generate_series(1, %s) AS g
+"""
+
+def list_before(conn, rows: int):
+    """Đường cũ: RealDictRow -> vá isoformat -> Question(**) -> to_dict()"""
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+        cursor.execute(QUERY, (rows,))
+        results = cursor.fetchall()
+    data = []
+    for result in results:
+        if 'created_at' in result and hasattr(result['created_at'], 'isoformat'):
+            result['created_at'] = result['created_at'].isoformat()
+        if 'updated_at' in result and result['updated_at'] and hasattr(result['updated_at'], 'isoformat'):
+            result['updated_at'] = result['updated_at'].isoformat()
+        question = Question(**result)
+        question.mark = float(question.mark)
+        data.append(question.to_dict())
+    return data
+
+def list_after(rows: int):
+    """Đường mới: tuple cursor + typecaster -> Question(**) -> to_dict()"""
+    return [Question(**result).to_dict() for result in db.execute_query(QUERY, (rows,))]
+
+def measure(func, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db.connect()
+    try:
+        # Connection thường (không đăng ký decoder) cho đường cũ
+        raw_conn = psycopg2.connect(db.pool.dsn)
+        try:
+            before = measure(lambda: list_before(raw_conn, args.rows), args.repeat)
+        finally:
+            raw_conn.close()
+        after = measure(lambda: list_after(args.rows), args.repeat)
+    finally:
+        db.close()
+
+    per_10k = 10000 / args.rows * 1000
+    print(f"rows={args.rows} repeat={args.repeat}")
+    for label, timings in (('before', before), ('after', after)):
+        print(f"{label:>6}: median {statistics.median(timings) * per_10k:8.2f} ms / 10k rows"
+              f"  (min {min(timings) * per_10k:.2f})")
+    print(f"speedup: {statistics.median(before) / statistics.median(after):.2f}x")
+
+if __name__ == '__main__':
+    main()
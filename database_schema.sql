@@ -61,6 +61,8 @@ CREATE TABLE IF NOT EXISTS questions (
 );
 CREATE INDEX IF NOT EXISTS idx_questions_subject ON questions(subject_id);
 CREATE INDEX IF NOT EXISTS idx_questions_unit_text ON questions(unit_text);
+-- Keyset pagination theo id trong từng môn (WHERE subject_id = ? AND id > ? ORDER BY id LIMIT ?)
+CREATE INDEX IF NOT EXISTS idx_questions_subject_id ON questions(subject_id, id);
 
 -- =========================
 -- 5) CHOICES (Phương án)
@@ -154,3 +156,199 @@ INSERT INTO users (username, password, role) VALUES
 ('2', '2', 'editor'),
 ('3', '3', 'generator')
 ON CONFLICT (username) DO NOTHING;
+
+-- =========================
+-- 10) FULL-TEXT SEARCH (Tìm kiếm câu hỏi/đáp án)
+-- =========================
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() chỉ là STABLE nên không dùng được trong generated column/index:
+-- bọc lại với dictionary chỉ định rõ để khai báo IMMUTABLE
+CREATE OR REPLACE FUNCTION f_unaccent(TEXT)
+RETURNS TEXT AS $$
+  SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+-- Config 'simple' (không stemming) + bỏ dấu: "cau hoi" khớp "câu hỏi"
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+  GENERATED ALWAYS AS (to_tsvector('simple', f_unaccent(question))) STORED;
+CREATE INDEX IF NOT EXISTS idx_questions_search ON questions USING GIN (search_vector);
+
+ALTER TABLE choices ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+  GENERATED ALWAYS AS (to_tsvector('simple', f_unaccent(content))) STORED;
+CREATE INDEX IF NOT EXISTS idx_choices_search ON choices USING GIN (search_vector);
+
+-- =========================
+-- 11) CONTENT HASH (Phát hiện câu hỏi trùng)
+-- =========================
+-- Hash của nội dung đã chuẩn hóa (gộp khoảng trắng, bỏ khoảng trắng đầu/cuối, chữ thường).
+-- Ứng dụng so khớp bằng chính hàm này nên hai phía luôn chuẩn hóa giống nhau
+CREATE OR REPLACE FUNCTION question_content_hash(TEXT)
+RETURNS TEXT AS $$
+  SELECT md5(lower(btrim(regexp_replace($1, '\s+', ' ', 'g'))))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS content_hash TEXT
+  GENERATED ALWAYS AS (question_content_hash(question)) STORED;
+
+-- Nếu dữ liệu cũ đã có câu trùng trong cùng môn, cần xóa bớt trước khi tạo index
+CREATE UNIQUE INDEX IF NOT EXISTS uq_questions_subject_content_hash
+ON questions(subject_id, content_hash);
+
+-- =========================
+-- 12) SIMILARITY INDEX (MinHash/LSH phát hiện câu hỏi gần giống)
+-- =========================
+-- Signature MinHash của câu hỏi + đáp án (backend/services/similarity.py)
+CREATE TABLE IF NOT EXISTS question_minhash (
+  question_id INTEGER PRIMARY KEY REFERENCES questions(id) ON DELETE CASCADE,
+  signature   INTEGER[] NOT NULL
+);
+
+-- Mỗi câu hỏi có một bucket cho mỗi band; trùng bucket => ứng viên gần giống
+CREATE TABLE IF NOT EXISTS question_lsh_buckets (
+  band        SMALLINT NOT NULL,
+  bucket_hash BIGINT NOT NULL,
+  question_id INTEGER NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+  PRIMARY KEY (band, bucket_hash, question_id)
+);
+CREATE INDEX IF NOT EXISTS idx_lsh_buckets_question ON question_lsh_buckets(question_id);
+
+-- Dữ liệu có sẵn: python -m backend.services.similarity
+
+-- =========================
+-- 13) SOFT DELETE (Xóa mềm câu hỏi)
+-- =========================
+-- Câu hỏi bị xóa chỉ được đánh dấu; tác vụ nền xóa hẳn khi không còn đề nào dùng
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+-- Câu hỏi đã xóa không còn chặn việc tạo lại cùng nội dung: unique index chỉ áp dụng cho câu còn sống
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_indexes
+    WHERE indexname = 'uq_questions_subject_content_hash' AND indexdef NOT LIKE '%WHERE%'
+  ) THEN
+    DROP INDEX uq_questions_subject_content_hash;
+  END IF;
+END $$;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_questions_subject_content_hash
+ON questions(subject_id, content_hash) WHERE deleted_at IS NULL;
+
+-- Tác vụ dọn chỉ quét các câu đã xóa mềm
+CREATE INDEX IF NOT EXISTS idx_questions_deleted_at ON questions(deleted_at) WHERE deleted_at IS NOT NULL;
+
+-- =========================
+-- 14) COLLECTION VERSIONS (ETag cho các endpoint danh sách)
+-- =========================
+-- Bộ đếm version tăng dần theo từng collection, được trigger cập nhật khi dữ liệu thay đổi.
+-- API ghép version thành ETag: danh sách không đổi chỉ tốn một query nhỏ và trả 304
+CREATE TABLE IF NOT EXISTS collection_versions (
+  collection TEXT NOT NULL,              -- 'questions', 'subjects', 'exams', 'user_subjects'
+  scope_id   INTEGER NOT NULL DEFAULT 0, -- subject_id với 'questions'; 0 = cả bảng
+  version    BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (collection, scope_id)
+);
+
+CREATE OR REPLACE FUNCTION bump_collection_versions(p_collection TEXT, p_scope_ids INTEGER[])
+RETURNS VOID AS $$
+  INSERT INTO collection_versions (collection, scope_id, version)
+  SELECT DISTINCT p_collection, scope_id, 1
+  FROM unnest(p_scope_ids) AS scope_id
+  WHERE scope_id IS NOT NULL
+  ORDER BY scope_id  -- khóa các dòng theo thứ tự cố định, tránh deadlock giữa hai transaction
+  ON CONFLICT (collection, scope_id) DO UPDATE SET version = collection_versions.version + 1
+$$ LANGUAGE sql;
+
+-- Câu hỏi: tăng version của từng môn bị ảnh hưởng, một lần cho mỗi câu lệnh (kể cả insert hàng loạt)
+CREATE OR REPLACE FUNCTION trg_bump_questions_version()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM bump_collection_versions('questions', ARRAY(SELECT subject_id FROM new_rows));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM bump_collection_versions('questions', ARRAY(SELECT subject_id FROM old_rows));
+  ELSE
+    PERFORM bump_collection_versions('questions', ARRAY(
+      SELECT subject_id FROM old_rows UNION SELECT subject_id FROM new_rows
+    ));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_questions_version_insert ON questions;
+CREATE TRIGGER trg_questions_version_insert
+AFTER INSERT ON questions REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_questions_version();
+
+DROP TRIGGER IF EXISTS trg_questions_version_update ON questions;
+CREATE TRIGGER trg_questions_version_update
+AFTER UPDATE ON questions REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_questions_version();
+
+DROP TRIGGER IF EXISTS trg_questions_version_delete ON questions;
+CREATE TRIGGER trg_questions_version_delete
+AFTER DELETE ON questions REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_questions_version();
+
+-- Đáp án nằm trong danh sách câu hỏi: thay đổi đáp án tăng version của môn chứa câu hỏi
+CREATE OR REPLACE FUNCTION trg_bump_choices_version()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM bump_collection_versions('questions', ARRAY(
+      SELECT q.subject_id FROM new_rows c JOIN questions q ON q.id = c.question_id
+    ));
+  ELSE
+    PERFORM bump_collection_versions('questions', ARRAY(
+      SELECT q.subject_id FROM old_rows c JOIN questions q ON q.id = c.question_id
+    ));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_choices_version_insert ON choices;
+CREATE TRIGGER trg_choices_version_insert
+AFTER INSERT ON choices REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_choices_version();
+
+DROP TRIGGER IF EXISTS trg_choices_version_update ON choices;
+CREATE TRIGGER trg_choices_version_update
+AFTER UPDATE ON choices REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_choices_version();
+
+DROP TRIGGER IF EXISTS trg_choices_version_delete ON choices;
+CREATE TRIGGER trg_choices_version_delete
+AFTER DELETE ON choices REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_choices_version();
+
+-- Bảng nhỏ, ít ghi: một version cho cả bảng (tên collection truyền qua tham số trigger)
+CREATE OR REPLACE FUNCTION trg_bump_table_version()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM bump_collection_versions(TG_ARGV[0], ARRAY[0]);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_subjects_version ON subjects;
+CREATE TRIGGER trg_subjects_version
+AFTER INSERT OR UPDATE OR DELETE ON subjects
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_table_version('subjects');
+
+DROP TRIGGER IF EXISTS trg_exams_version ON exams;
+CREATE TRIGGER trg_exams_version
+AFTER INSERT OR UPDATE OR DELETE ON exams
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_table_version('exams');
+
+-- Danh sách đề có version_count (đếm exam_versions): tạo/xóa version cũng đổi ETag của exams
+DROP TRIGGER IF EXISTS trg_exam_versions_version ON exam_versions;
+CREATE TRIGGER trg_exam_versions_version
+AFTER INSERT OR UPDATE OR DELETE ON exam_versions
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_table_version('exams');
+
+DROP TRIGGER IF EXISTS trg_user_subjects_version ON user_subjects;
+CREATE TRIGGER trg_user_subjects_version
+AFTER INSERT OR UPDATE OR DELETE ON user_subjects
+FOR EACH STATEMENT EXECUTE FUNCTION trg_bump_table_version('user_subjects');
@@ -4,9 +4,13 @@ from typing import Dict, Any, List, Optional
 from .config import config
 
 class APIClient:
+    # Số response GET (kèm ETag) được giữ lại để gửi If-None-Match
+    MAX_ETAG_CACHE_ENTRIES = 32
+    
     def __init__(self, base_url: str = None):
         self.base_url = base_url or config.API_BASE_URL
         self.session = requests.Session()
+        self._etag_cache: Dict[str, Any] = {}
     
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """Make HTTP request to API"""
@@ -17,9 +21,28 @@ class APIClient:
             if 'timeout' not in kwargs:
                 kwargs['timeout'] = 10  # 10 seconds timeout
             
+            # GET đã có ETag: hỏi server bằng If-None-Match, 304 thì dùng lại dữ liệu đã có
+            cache_key, cached = None, None
+            if method == "GET":
+                cache_key = f"{endpoint}?{sorted((kwargs.get('params') or {}).items())}"
+                cached = self._etag_cache.get(cache_key)
+                if cached:
+                    kwargs['headers'] = {**kwargs.get('headers', {}), 'If-None-Match': cached[0]}
+            
             response = self.session.request(method, url, **kwargs)
+            if response.status_code == 304 and cached:
+                return cached[1]
             response.raise_for_status()
-            return response.json()
+            data = response.json()
+            
+            etag = response.headers.get('ETag')
+            if cache_key and etag:
+                self._etag_cache.pop(cache_key, None)
+                if len(self._etag_cache) >= self.MAX_ETAG_CACHE_ENTRIES:
+                    # Bỏ mục cũ nhất
+                    self._etag_cache.pop(next(iter(self._etag_cache)))
+                self._etag_cache[cache_key] = (etag, data)
+            return data
         except requests.exceptions.Timeout:
             raise Exception("API request timed out. Please try again.")
         except requests.exceptions.HTTPError as e:
@@ -81,20 +104,58 @@ class APIClient:
         """Get subject by ID"""
         return self._make_request("GET", f"/subjects/{subject_id}")
     
+    def get_subject_stats(self, subject_id: int) -> Dict[str, Any]:
+        """Get question bank statistics of a subject (total questions, by unit/mark/mix_choices)"""
+        return self._make_request("GET", f"/subjects/{subject_id}/stats")
+    
     def create_subject(self, name: str) -> Dict[str, Any]:
         """Create new subject"""
         return self._make_request("POST", "/subjects/", params={"name": name})
     
     # Questions
-    def get_questions(self, subject_id: Optional[int] = None, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Get questions, optionally filtered by subject and user_id"""
+    def get_questions(self, subject_id: Optional[int] = None, user_id: Optional[int] = None,
+                      after_id: Optional[int] = None, limit: Optional[int] = None,
+                      unit_text: Optional[str] = None, mark: Optional[float] = None,
+                      mix_choices: Optional[int] = None, summary: bool = False,
+                      fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Get questions, optionally filtered by subject and user_id.
+        
+        With limit, returns one page ordered by id; pass the last id as after_id
+        to get the next page. summary/fields return only the listed fields
+        (summary includes choice_count instead of choices)."""
         params = {}
         if subject_id:
             params["subject_id"] = subject_id
         if user_id:
             params["user_id"] = user_id
+        if after_id is not None:
+            params["after_id"] = after_id
+        if limit is not None:
+            params["limit"] = limit
+        if unit_text:
+            params["unit_text"] = unit_text
+        if mark is not None:
+            params["mark"] = mark
+        if mix_choices is not None:
+            params["mix_choices"] = mix_choices
+        if summary:
+            params["summary"] = "true"
+        if fields:
+            params["fields"] = ",".join(fields)
         return self._make_request("GET", "/questions/", params=params)
     
+    def search_questions(self, q: str, subject_id: Optional[int] = None, user_id: Optional[int] = None,
+                         limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Full-text search over question and choice content, ranked by relevance"""
+        params = {"q": q}
+        if subject_id:
+            params["subject_id"] = subject_id
+        if user_id:
+            params["user_id"] = user_id
+        if limit is not None:
+            params["limit"] = limit
+        return self._make_request("GET", "/questions/search", params=params)
+    
     def get_question(self, question_id: int) -> Dict[str, Any]:
         """Get question by ID"""
         return self._make_request("GET", f"/questions/{question_id}")
@@ -103,6 +164,10 @@ class APIClient:
         """Create new question"""
         return self._make_request("POST", "/questions/", json=question_data)
     
+    def create_questions_batch(self, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Create many questions in one transaction; returns per-item results"""
+        return self._make_request("POST", "/questions/batch", json={"questions": questions})
+    
     def update_question(self, question_id: int, question_data: Dict[str, Any]) -> Dict[str, Any]:
         """Update question"""
         return self._make_request("PUT", f"/questions/{question_id}", json=question_data)
@@ -111,10 +176,19 @@ class APIClient:
         """Delete question"""
         return self._make_request("DELETE", f"/questions/{question_id}")
     
+    def delete_questions(self, question_ids: List[int]) -> Dict[str, Any]:
+        """Delete many questions with one request"""
+        return self._make_request("DELETE", "/questions/", json={"ids": question_ids})
+    
     # Exams
-    def get_exams(self) -> List[Dict[str, Any]]:
-        """Get all exams"""
-        return self._make_request("GET", "/exams/")
+    def get_exams(self, summary: bool = False, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Get all exams (summary/fields return only the listed fields)"""
+        params = {}
+        if summary:
+            params["summary"] = "true"
+        if fields:
+            params["fields"] = ",".join(fields)
+        return self._make_request("GET", "/exams/", params=params)
     
     def get_exam(self, exam_id: int) -> Dict[str, Any]:
         """Get exam by ID"""
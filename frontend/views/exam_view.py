@@ -214,9 +214,9 @@ class ExamView(tk.Frame):
             for subject in self.subjects:
                 if subject['name'] == selected_subject:
                     try:
-                        questions = self.api_client.get_questions(subject_id=subject['id'])
+                        stats = self.api_client.get_subject_stats(subject['id'])
                         self.subject_info_label.config(
-                            text=f"(Có {len(questions)} câu hỏi trong môn này)"
+                            text=f"(Có {stats['total_questions']} câu hỏi trong môn này)"
                         )
                     except:
                         self.subject_info_label.config(text="(Không thể load số câu hỏi)")
@@ -230,7 +230,7 @@ class ExamView(tk.Frame):
                 self.tree.delete(item)
             
             # Load exams
-            self.exams = self.api_client.get_exams()
+            self.exams = self.api_client.get_exams(summary=True)
             
             # Add to treeview
             for exam in self.exams:
@@ -298,9 +298,9 @@ class ExamView(tk.Frame):
         
         # Check available questions
         try:
-            questions = self.api_client.get_questions(subject_id=subject_id)
-            if num_questions > len(questions):
-                messagebox.showerror("Error", f"Số câu hỏi ({num_questions}) vượt quá số câu hỏi có sẵn ({len(questions)})")
+            available = self.api_client.get_subject_stats(subject_id)['total_questions']
+            if num_questions > available:
+                messagebox.showerror("Error", f"Số câu hỏi ({num_questions}) vượt quá số câu hỏi có sẵn ({available})")
                 return
         except Exception as e:
             messagebox.showerror("Error", f"Không thể kiểm tra số câu hỏi: {str(e)}")
@@ -302,6 +302,9 @@ class ImportView(tk.Frame):
                 message = f"Imported {imported_count} out of {total_count} questions"
                 if skipped_count > 0:
                     message += f"\nSkipped {skipped_count} duplicate questions"
+                warnings = response.get('warnings', [])
+                if warnings:
+                    message += f"\n\n{len(warnings)} possible near-duplicate questions:\n" + "\n".join(warnings[:10])
                 
                 messagebox.showinfo("Success", message)
                 self.go_back()
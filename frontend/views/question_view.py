@@ -5,12 +5,15 @@ from ..config import config
 from ..api_client import APIClient
 
 class QuestionView(tk.Frame):
+    PAGE_SIZE = 200
+    
     def __init__(self, parent, user_data: Dict[str, Any], api_client: APIClient = None):
         super().__init__(parent)
         self.user_data = user_data
         self.api_client = api_client or APIClient()
         self.questions = []
         self.subjects = []
+        self.last_question_id = None
         
         self.setup_ui()
         self.load_data()
@@ -122,6 +125,30 @@ class QuestionView(tk.Frame):
         )
         self.subject_combobox.pack(side='left', padx=(0, 20), pady=10)
         self.subject_combobox.bind('<<ComboboxSelected>>', self.on_subject_changed)
+        
+        # Search box (full-text, gõ không dấu vẫn được)
+        search_label = tk.Label(
+            filter_frame,
+            text="Search:",
+            font=config.NORMAL_FONT,
+            bg=config.BACKGROUND_COLOR
+        )
+        search_label.pack(side='left', padx=(0, 10), pady=10)
+        
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(filter_frame, textvariable=self.search_var, font=config.NORMAL_FONT, width=30)
+        search_entry.pack(side='left', padx=(0, 10), pady=10)
+        search_entry.bind('<Return>', lambda event: self.load_questions())
+        
+        search_button = tk.Button(
+            filter_frame,
+            text="Search",
+            font=config.NORMAL_FONT,
+            bg=config.PRIMARY_COLOR,
+            fg="black",
+            command=self.load_questions
+        )
+        search_button.pack(side='left', pady=10)
     
     def setup_questions_list(self, parent):
         """Setup questions list"""
@@ -146,6 +173,18 @@ class QuestionView(tk.Frame):
         
         # Bind double click
         self.tree.bind('<Double-1>', self.on_question_double_click)
+        
+        # Load more button (câu hỏi được tải theo trang)
+        self.load_more_button = tk.Button(
+            parent,
+            text="Load More",
+            font=config.NORMAL_FONT,
+            bg=config.SECONDARY_COLOR,
+            fg="black",
+            command=self.load_more_questions,
+            state='disabled'
+        )
+        self.load_more_button.pack(pady=(10, 0))
     
     def load_data(self):
         """Load subjects and questions"""
@@ -167,12 +206,17 @@ class QuestionView(tk.Frame):
             self.go_back()
     
     def load_questions(self):
-        """Load questions based on filter"""
+        """Load first page of questions based on filter"""
+        # Clear existing items
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        self.questions = []
+        self.last_question_id = None
+        self.load_more_questions()
+    
+    def load_more_questions(self):
+        """Load next page of questions and append to treeview"""
         try:
-            # Clear existing items
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
             # Get selected subject
             subject_name = self.subject_var.get()
             subject_id = None
@@ -184,10 +228,27 @@ class QuestionView(tk.Frame):
             
             # Load questions - API sẽ tự động filter theo user_id
             user_id = self.user_data.get('id')
-            self.questions = self.api_client.get_questions(subject_id=subject_id, user_id=user_id)
+            search_text = self.search_var.get().strip()
+            if search_text:
+                # Kết quả tìm kiếm đã sắp theo độ liên quan, không phân trang
+                page = self.api_client.search_questions(search_text, subject_id=subject_id, user_id=user_id)
+                self.load_more_button.config(state='disabled')
+            else:
+                page = self.api_client.get_questions(
+                    subject_id=subject_id,
+                    user_id=user_id,
+                    after_id=self.last_question_id,
+                    limit=self.PAGE_SIZE,
+                    summary=True
+                )
+                # Trang đầy thì có thể còn câu hỏi phía sau
+                self.load_more_button.config(state='normal' if len(page) == self.PAGE_SIZE else 'disabled')
+            self.questions.extend(page)
+            if page:
+                self.last_question_id = page[-1]['id']
             
             # Add to treeview
-            for question in self.questions:
+            for question in page:
                 try:
                     subject_name = "Unknown"
                     for subject in self.subjects:
@@ -195,9 +256,12 @@ class QuestionView(tk.Frame):
                             subject_name = subject['name']
                             break
                     
-                    question_text = question.get('question', '')
-                    if len(question_text) > 50:
-                        question_text = question_text[:50] + "..."
+                    # Danh sách summary có question_snippet đã rút gọn ở server; kết quả tìm kiếm có toàn văn
+                    question_text = question.get('question_snippet')
+                    if question_text is None:
+                        question_text = question.get('question', '')
+                        if len(question_text) > 50:
+                            question_text = question_text[:50] + "..."
                     
                     self.tree.insert('', 'end', values=(
                         question.get('id', ''),
@@ -205,7 +269,7 @@ class QuestionView(tk.Frame):
                         question_text,
                         question.get('unit_text', ''),
                         question.get('mark', ''),
-                        len(question.get('choices', []))
+                        question.get('choice_count', len(question.get('choices', [])))
                     ))
                 except Exception as e:
                     # Skip problematic questions